@@ -1,4 +1,6 @@
 from .direct_energy_estimation import DirectEnergyEstimation
 from .direct_fidelity_estimation import DirectFidelityEstimation, DirectFidelityEstimation2
 from .quantum_process_tomography import QuantumProcessTomography
-from .quantum_state_tomography import QuantumStateTomography
\ No newline at end of file
+from .quantum_state_tomography import QuantumStateTomography
+from .readout_calibration import ReadoutCalibration
+from .classical_shadow import ClassicalShadow
\ No newline at end of file
@@ -0,0 +1,200 @@
+import numpy as np
+from .direct_estimation import DirectEstimation
+from ...objects import Report
+from ...util.pauli_expression import PauliObservable
+from ...util.pauli_expression.sparse_pauli import pauli_decompose
+from ...util.pauli_expression.symplectic import POPCOUNT, pack_labels
+from ...util.pauli_expression.common import pauli_labels
+from ...util.histogram import Histogram
+
+BLOCK_SIZE = 64
+ROUND_ERROR = 1e-10
+
+def _terms(observable):
+    """{label: coefficient} of a PauliObservable, a dict or a single label"""
+    if isinstance(observable, PauliObservable):
+        return observable.obs
+    if isinstance(observable, str):
+        return {observable: 1}
+    return dict(observable)
+
+class ClassicalShadow:
+    def __init__(
+        self,
+        number_of_qubit,
+        number_of_basis,
+        shot = None,
+        seed = None,
+        ):
+        """Classical shadows from random Pauli bases
+
+        Each snapshot is stored bit-packed as the (x, z) bits of its basis, in the
+        layout of pack_labels, and the packed outcome bits. Its estimate of a Pauli P
+        is 3^|P| (-1)^(outcome . P) if the basis agrees with P on the support of P, and 0
+        otherwise.
+
+        Args:
+            number_of_qubit (int): number of qubits
+            number_of_basis (int): number of random measurement bases
+            shot (int): shots of each basis, the default of take_data if None
+            seed (int): seed of the random bases
+        """
+        self.name = "ClassicalShadow"
+        self.number_of_qubit = number_of_qubit
+        self.number_of_basis = number_of_basis
+        self.shot = shot
+        choice = np.random.default_rng(seed).integers(0, 3, size=(number_of_basis, number_of_qubit))
+        self.bases = ["".join(row) for row in np.array(list("XYZ"))[choice]]
+
+    @staticmethod
+    def required_bases(observables, precision, failure_probability=0.05):
+        """Number of bases predicting all observables within precision [Huang, Kueng, Preskill]
+
+        N = 2 ln(2L/delta) * 34/epsilon^2 * max ||O||_shadow^2, where the shadow norm
+        of the traceless part of O = sum_P c_P P is bounded by sum_P |c_P| 3^(|P|/2).
+
+        Args:
+            observables (list): PauliObservables, {label: coefficient} or labels
+            precision (float): additive error of every estimate
+            failure_probability (float): probability that any estimate exceeds precision
+        Returns:
+            int: number of bases with one shot each
+        """
+        norm = 0
+        for observable in observables:
+            terms = _terms(observable)
+            norm  = max(norm, sum(abs(coeff)*3**((len(label)-label.count("I"))/2) for label, coeff in terms.items() if label.strip("I")))
+        group_number = int(np.ceil(2*np.log(2*len(observables)/failure_probability)))
+        return group_number*int(np.ceil(34*norm**2/precision**2))
+
+    def set_circuit(self, circuits, qubit_index, readout_mitigation=None, result_directory=None):
+        self.circuit = list(circuits.values())[0]
+        self.qubit_index = qubit_index
+        self.readout_mitigation = readout_mitigation
+        self.result_directory = result_directory
+
+    def prepare(self, ansatz):
+        spam_condition_list = []
+        for basis in self.bases:
+            spam_condition = {
+                "prep_pauli" : "I"*self.number_of_qubit,
+                "meas_pauli" : basis,
+                "prep_index" : "0"*self.number_of_qubit,
+            }
+            if self.shot is not None:
+                spam_condition["shot"] = self.shot
+            spam_condition_list.append(spam_condition)
+        self.de = DirectEstimation(ansatz, self.circuit, self.qubit_index, spam_condition_list, result_directory=self.result_directory)
+        self.job_table = self.de.job_table
+
+    def execute(self, take_data):
+        self.de.execute(take_data)
+
+    def analyze(self):
+        """Store the snapshots of every basis as packed arrays
+
+        The histograms are not merged by basis, so that repeated bases stay
+        separate samples. Each basis has its outcomes in consecutive rows starting
+        at basis_start, weighted by their normalized histogram values.
+        """
+        n = self.number_of_qubit
+        shift = np.arange(n-1, -1, -1, dtype=np.int64)
+        outcomes, weights, start = [], [], []
+        for job in self.de.job_table.table:
+            histogram = Histogram.from_dict(job.result if job.result is not None else job.shots)
+            if self.readout_mitigation is not None:
+                histogram = self.readout_mitigation.apply(histogram)
+            histogram = histogram.to_sparse().normalized()
+            start.append(sum(len(weight) for weight in weights))
+            outcomes.append(np.packbits((histogram.outcomes[:, None] >> shift) & 1, axis=1))
+            weights.append(histogram.count)
+        self.basis_x, self.basis_z = pack_labels([job.meas_pauli for job in self.de.job_table.table])
+        self.outcome     = np.concatenate(outcomes)
+        self.weight      = np.concatenate(weights)
+        self.basis_start = np.array(start, dtype=np.int64)
+
+        self.report = Report(name="classical_shadow")
+        self.report.add_information("bases", self.bases)
+        self.report.add_information("outcome", self.outcome)
+        self.report.add_information("weight", self.weight)
+        self.report.add_information("basis start", self.basis_start)
+        self.report.add_information("qubit index", self.qubit_index)
+
+    def basis_estimates(self, paulis):
+        """Estimate of each Pauli from each basis, averaged over the outcomes of the basis
+
+        Args:
+            paulis (list): Pauli labels
+        Returns:
+            np.ndarray: (len(paulis), number of bases) array
+        """
+        out = np.empty((len(paulis), len(self.basis_start)))
+        for start in range(0, len(paulis), BLOCK_SIZE):
+            x, z  = pack_labels(paulis[start:start+BLOCK_SIZE])
+            mask  = x | z
+            agree = ~np.any(((self.basis_x[None] ^ x[:, None]) | (self.basis_z[None] ^ z[:, None])) & mask[:, None], axis=2)
+            sign  = 1 - 2*(POPCOUNT[self.outcome[None] & mask[:, None]].sum(axis=2) % 2).astype(float)
+            scale = 3.0**POPCOUNT[mask].sum(axis=1)
+            out[start:start+BLOCK_SIZE] = scale[:, None]*agree*np.add.reduceat(sign*self.weight, self.basis_start, axis=1)
+        return out
+
+    def median_of_means(self, estimates, group_number):
+        """Median over group_number groups of bases of the mean estimate of each group
+
+        Args:
+            estimates (np.ndarray): (observables, number of bases) array
+            group_number (int): number of groups, limited to the number of bases
+        Returns:
+            np.ndarray: estimate of each observable
+        """
+        size  = estimates.shape[1]
+        if size == 0:
+            raise ValueError("No snapshots, run analyze on measured data first")
+        group_number = max(1, min(group_number, size))
+        start = np.arange(group_number)*size//group_number
+        means = np.add.reduceat(estimates, start, axis=1)/np.diff(np.append(start, size))
+        return np.median(means, axis=1)
+
+    def expect(self, observables, failure_probability=0.05, group_number=None):
+        """Median-of-means estimates of observables from the same snapshots
+
+        Args:
+            observables (list): PauliObservables, {label: coefficient} or labels
+            failure_probability (float): sets 2 ln(2L/delta) groups for L observables
+            group_number (int): number of groups, overrides failure_probability, 1 for the plain mean
+        Returns:
+            np.ndarray: estimate of each observable
+        """
+        terms  = [_terms(observable) for observable in observables]
+        labels = sorted(set(label for term in terms for label in term))
+        coeffs = np.zeros((len(terms), len(labels)))
+        position = {label: i for i, label in enumerate(labels)}
+        for row, term in enumerate(terms):
+            for label, coeff in term.items():
+                coeffs[row, position[label]] = np.real(coeff)
+        if group_number is None:
+            group_number = int(np.ceil(2*np.log(2*len(terms)/failure_probability)))
+        return self.median_of_means(coeffs@self.basis_estimates(labels), group_number)
+
+    def fidelity(self, state, failure_probability=0.05, group_number=None):
+        """Fidelity <psi|rho|psi> or Tr(sigma rho) with a target state
+
+        The target is expanded in the Pauli basis, so stabilizer states use 2^n terms
+        and general states up to 4^n.
+
+        Args:
+            state (np.ndarray): state vector or density matrix of the target
+            failure_probability (float): probability that the estimate exceeds its error bound
+            group_number (int): number of groups, overrides failure_probability
+        Returns:
+            float: estimated fidelity
+        """
+        state  = np.asarray(state)
+        matrix = np.outer(state, state.conj()) if state.ndim == 1 else state
+        values = pauli_decompose(matrix).real/2**self.number_of_qubit
+        labels = pauli_labels(self.number_of_qubit)
+        terms  = {labels[index]: values[index] for index in np.flatnonzero(np.abs(values) > ROUND_ERROR)}
+        return float(self.expect([terms], failure_probability, group_number)[0])
+
+    def visualize(self):
+        print(self.report.name)
@@ -1,16 +1,20 @@
 import itertools
 import numpy as np
 import matplotlib.pyplot as plt
-from .direct_estimation import DirectEstimation
+from .direct_estimation import MitigatedDirectEstimation
 from ...objects import Report
 from ...util.pauli_expression import PauliObservable
 from ...util.visualize import show_po
 from ...util.indicator import energy
-from ...util.histogram import expect_pauli
+from ...util.histogram import Histogram, expect_paulis, variance_pauli_sum, covariance_paulis
+from ...util.mitigation import extrapolate, extrapolation_weights
 
-def find_intercept(xdata, ydata):
-    slope, intercept = np.polyfit(xdata, ydata, 1)
-    return intercept
+def _merge(first, first_shots, second, second_shots):
+    """Normalized histogram of the shots of two normalized histograms"""
+    first, second = first.to_sparse(), second.to_sparse()
+    index, inverse = np.unique(np.concatenate([first.index, second.index]), return_inverse=True)
+    count = np.bincount(inverse, weights=np.concatenate([first.count*first_shots, second.count*second_shots]))
+    return Histogram(first.n, index=index, count=count/(first_shots + second_shots))
 
 class DirectEnergyEstimation:
     def __init__(
@@ -18,78 +22,231 @@ class DirectEnergyEstimation:
         hamiltonian_notation,
         clique_cover_strategy,
         excitation_number = 1,
+        grouping = "qubit_wise",
+        extrapolation = "linear",
+        precision = None,
+        total_shots = None,
+        shot_allocation = "coefficient",
+        stopping_precision = None,
+        round_shots = 1000,
+        max_rounds = 20,
         ):
 
         self.name = "DirectEnergyEstimation"
-        self.number_of_qubit = int(np.log2(hamiltonian_notation.shape[0]))
+        if isinstance(hamiltonian_notation, np.ndarray):
+            self.po_target = PauliObservable(observable = hamiltonian_notation)
+        else:
+            self.po_target = PauliObservable(terms = hamiltonian_notation)
+        self.po_target.calculate()
+        self.number_of_qubit = self.po_target.n
         self.excitation_number = excitation_number
         self.prep_index = ["0"*i + "1" + "0"*(self.number_of_qubit-i-1) for i in range(excitation_number)]
-        self.po_target = PauliObservable(observable = hamiltonian_notation)
-        self.po_target.calculate()
-        self.po_target.get_graph()
+        self.po_target.get_graph(grouping=grouping)
         self.po_target.get_clique_dict(strategy=clique_cover_strategy)
         self.clique_cover_strategy = clique_cover_strategy
+        self.extrapolation = extrapolation
+        self.precision = precision
+        self.total_shots = total_shots
+        self.shot_allocation = shot_allocation
+        self.stopping_precision = stopping_precision
+        self.round_shots = round_shots
+        self.max_rounds = max_rounds
+        self.clique_variance = None
+        self.standard_errors = None
+
+    def update_hamiltonian(self, added=None, removed=None):
+        """Change a few Hamiltonian terms, regrouping only the affected cliques
+
+        Call prepare again afterwards to measure the new cliques.
 
-    def set_circuit(self, circuits, qubit_index):
+        Args:
+            added (list): [(label, coefficient), ...] or {label: coefficient}, added to existing coefficients
+            removed (list): labels to remove
+        """
+        self.po_target.update_terms(added=added, removed=removed)
+
+    def clique_deviation(self, variances=None):
+        """Single-shot standard deviation of the energy estimator of each clique
+
+        Args:
+            variances (dict): {clique_label: variance} measured in a previous iteration
+        Returns:
+            dict: {clique_label: deviation}, sqrt(sum_i c_i^2) of the non-identity terms if variances is None
+        """
+        deviation = {}
+        for clique_label, clique_nodes in self.po_target.clique_dict.items():
+            if variances is not None and clique_label in variances:
+                deviation[clique_label] = np.sqrt(variances[clique_label])
+            else:
+                coefficients = [self.po_target.obs[label] for label in clique_nodes if label != "I"*self.number_of_qubit]
+                deviation[clique_label] = np.sqrt(np.sum(np.abs(coefficients)**2))
+        return deviation
+
+    def allocate_shots(self, precision=None, total_shots=None, variances=None, min_shots=1):
+        """Shots of each clique minimizing the energy variance sum_g sigma_g^2/N_g
+
+        The optimum is N_g proportional to sigma_g. For a target standard error
+        precision, the total is (sum_g sigma_g)^2/precision^2.
+
+        Args:
+            precision (float): target standard error of the energy
+            total_shots (int): total number of shots per prep index, used if precision is None
+            variances (dict): {clique_label: variance} measured in a previous iteration
+            min_shots (int): minimum number of shots of each clique
+        Returns:
+            dict: {clique_label: shots}
+        """
+        deviation = self.clique_deviation(variances)
+        labels = list(deviation.keys())
+        sigma = np.array([deviation[label] for label in labels])
+        if precision is not None:
+            total_shots = int(np.ceil(np.sum(sigma)**2/precision**2))
+        total_shots = max(total_shots, min_shots*len(labels))
+        if np.sum(sigma) == 0:
+            sigma = np.ones(len(labels))
+        # minimum shots first, the rest proportionally to sigma with largest remainders
+        ideal = min_shots + (total_shots - min_shots*len(labels))*sigma/np.sum(sigma)
+        shots = np.floor(ideal).astype(int)
+        shots[np.argsort(shots - ideal)[:total_shots - np.sum(shots)]] += 1
+        return dict(zip(labels, shots.tolist()))
+
+    def measured_variance(self):
+        """Single-shot variance c^T Cov c of every clique from the covariance of its measured parities
+
+        Returns:
+            dict: {stretch key: {prep_index: {clique_label: variance}}} of the current data tables
+        """
+        variance = {}
+        for key, data_table in self.de.data_tables.items():
+            variance[key] = {}
+            for index in self.prep_index:
+                variance[key][index] = {}
+                for clique_label, clique_nodes in self.po_target.clique_dict.items():
+                    measured = [self.po_target.measured_pauli.get(meas_pauli, (meas_pauli, 1)) for meas_pauli in clique_nodes]
+                    coefficients = np.real([sign*self.po_target.obs[meas_pauli] for meas_pauli, (_, sign) in zip(clique_nodes, measured)])
+                    covariance = covariance_paulis([label for label, _ in measured], data_table[("I"*self.number_of_qubit, clique_label)][index])
+                    variance[key][index][clique_label] = max(float(coefficients@covariance@coefficients), 0)
+        return variance
+
+    def standard_error(self, variance=None):
+        """Standard error of the extrapolated energy of each prep index
+
+        The energy extrapolated from the stretch factors is sum_k w_k E_k, so its
+        variance is sum_k w_k^2 sum_g Var_gk/N_g with the shots N_g of each clique.
+
+        Args:
+            variance (dict): result of measured_variance, computed if None
+        Returns:
+            dict: {prep_index: standard error}
+        """
+        if self.shots is None:
+            raise ValueError("Unknown shots, set precision, total_shots or stopping_precision")
+        if variance is None:
+            variance = self.measured_variance()
+        weights = extrapolation_weights(self.de.keys, model=self.extrapolation)
+        labels = list(self.po_target.clique_dict.keys())
+        shots = np.array([self.shots[label] for label in labels])
+        error = {}
+        for index in self.prep_index:
+            values = np.array([[variance[key][index][label] for label in labels] for key in self.de.keys])
+            error[index] = float(np.sqrt(weights**2@values@(1/shots)))
+        return error
+
+    def set_circuit(self, circuits, qubit_index, readout_mitigation=None, result_directory=None):
         self.circuits = circuits
         self.qubit_index = qubit_index
+        self.readout_mitigation = readout_mitigation
+        self.result_directory = result_directory
 
     def prepare(self, ansatz):
+        self.shots = None
+        if self.precision is not None or self.total_shots is not None:
+            variances = self.clique_variance if self.shot_allocation == "variance" else None
+            self.shots = self.allocate_shots(precision=self.precision, total_shots=self.total_shots, variances=variances)
+
         spam_condition_list = []
         for clique_key in self.po_target.clique_dict.keys():
             for index in self.prep_index:
-                spam_condition_list.append(
-                    {
-                        "prep_pauli" : "I"*self.number_of_qubit,
-                        "meas_pauli" : clique_key,
-                        "prep_index" : index,
-                    }
-                )
-
-        self.des = {}
-        for key, circuit in self.circuits.items():
-            self.des[key] = DirectEstimation(ansatz, circuit, self.qubit_index, spam_condition_list)
-        
+                spam_condition = {
+                    "prep_pauli" : "I"*self.number_of_qubit,
+                    "meas_pauli" : clique_key,
+                    "prep_index" : index,
+                    "meas_clifford" : self.po_target.clique_circuit.get(clique_key),
+                }
+                if self.shots is not None:
+                    spam_condition["shot"] = self.shots[clique_key]
+                spam_condition_list.append(spam_condition)
+
         # for variational_optimization : line 19
-        self.de = self.des[1]
+        self.de = MitigatedDirectEstimation(ansatz, self.circuits, self.qubit_index, spam_condition_list, result_directory=self.result_directory)
+        self.job_table = self.de.job_table
 
     def execute(self, take_data):
-        for de in self.des.values():
-            de.execute(take_data)
+        if self.stopping_precision is None:
+            self.rounds = 1
+            self.de.execute(take_data)
+        else:
+            self.execute_rounds(take_data)
+
+    def execute_rounds(self, take_data):
+        """Take data in rounds of round_shots until the standard error reaches stopping_precision
+
+        The shots of each round are allocated to the cliques as in allocate_shots and
+        merged with the previous rounds, so job.result and job.shot hold all the shots.
+        """
+        jobs = self.de.job_table.table
+        merged = [None]*len(jobs)
+        self.shots = {clique_label: 0 for clique_label in self.po_target.clique_dict.keys()}
+        variances = self.clique_variance if self.shot_allocation == "variance" else None
+        for self.rounds in range(1, self.max_rounds+1):
+            shots = self.allocate_shots(total_shots=self.round_shots, variances=variances)
+            for job in jobs:
+                job.shot = shots[job.meas_pauli]
+            take_data(self.de.job_table)
+            for position, job in enumerate(jobs):
+                histogram = Histogram.from_dict(job.result if job.result is not None else job.shots)
+                if merged[position] is not None:
+                    histogram = _merge(merged[position], self.shots[job.meas_pauli], histogram, job.shot)
+                merged[position] = histogram
+            self.shots = {clique_label: self.shots[clique_label] + shots[clique_label] for clique_label in self.shots.keys()}
+            for job, histogram in zip(jobs, merged):
+                job.result, job.shot = histogram, self.shots[job.meas_pauli]
+
+            self.de.make_data_table(mitigation=self.readout_mitigation)
+            variance = self.measured_variance()
+            self.standard_errors = self.standard_error(variance)
+            if max(self.standard_errors.values()) <= self.stopping_precision:
+                break
+            if self.shot_allocation == "variance":
+                variances = {clique_label: np.mean([variance[self.de.keys[0]][index][clique_label] for index in self.prep_index]) for clique_label in self.shots.keys()}
 
     def analyze(self):
-        for de in self.des.values():
-            de.make_data_table()
+        self.de.make_data_table(mitigation=self.readout_mitigation)
 
         po_ansatzs = {}
+        self.clique_variance = {clique_label: 0 for clique_label in self.po_target.clique_dict.keys()}
         for index in self.prep_index:
             po_ansatzs[index] = {}
-            for key, de in self.des.items():
+            for key, data_table in self.de.data_tables.items():
                 po_ansatzs[index][key] = {}
                 for clique_label, clique_nodes in self.po_target.clique_dict.items():
-                    for meas_pauli in clique_nodes:
-                        meas_histogram = de.data_table[("I"*self.number_of_qubit, clique_label)][index]
-                        expected_value = expect_pauli(meas_pauli, meas_histogram)
-                        po_ansatzs[index][key][meas_pauli] = expected_value
+                    meas_histogram = data_table[("I"*self.number_of_qubit, clique_label)][index]
+                    measured = [self.po_target.measured_pauli.get(meas_pauli, (meas_pauli, 1)) for meas_pauli in clique_nodes]
+                    expected_values = expect_paulis([label for label, _ in measured], meas_histogram)
+                    for meas_pauli, (_, sign), expected_value in zip(clique_nodes, measured, expected_values):
+                        po_ansatzs[index][key][meas_pauli] = sign*expected_value
+                    if key == self.de.keys[0]:
+                        coefficients = [sign*self.po_target.obs[meas_pauli] for meas_pauli, (_, sign) in zip(clique_nodes, measured)]
+                        self.clique_variance[clique_label] += variance_pauli_sum([label for label, _ in measured], coefficients, meas_histogram)/len(self.prep_index)
                         
         for index in self.prep_index:
-            if len(self.des) != 1:
-                po_ansatzs[index][0] = {}
-                for clique_label, clique_nodes in self.po_target.clique_dict.items():
-                    for meas_pauli in clique_nodes:
-                        xdata = []
-                        ydata = []
-                        for key, de in self.des.items():
-                            xdata.append(key)
-                            ydata.append(po_ansatzs[index][key][meas_pauli])
-                        intercept = find_intercept(xdata, ydata)
-                        if intercept < -1:
-                            intercept = -1
-                        elif intercept > +1:
-                            intercept = +1
-                        po_ansatzs[index][0][meas_pauli] = intercept
+            if len(self.de.keys) != 1:
+                labels = list(po_ansatzs[index][self.de.keys[0]].keys())
+                values = np.array([[po_ansatzs[index][key][label] for label in labels] for key in self.de.keys])
+                intercepts = extrapolate(self.de.keys, values, model=self.extrapolation)
+                po_ansatzs[index][0] = dict(zip(labels, intercepts))
             else:
-                po_ansatzs[index][0] = po_ansatzs[index][list(self.des.keys())[0]]
+                po_ansatzs[index][0] = po_ansatzs[index][self.de.keys[0]]
 
         self.po_ansatzs = {}
         for index in self.prep_index:
@@ -110,8 +267,13 @@ class DirectEnergyEstimation:
         self.report.add_information("energy", self.energy)
         self.report.add_information("pauli expected values", self.po_ansatzs)
         self.report.add_information("qubit index", self.qubit_index)
-        for key, val in self.des.items():
-            self.report.add_information(f"data table {key}", val.data_table)
+        if self.shots is not None:
+            self.report.add_information("shots", self.shots)
+        if self.stopping_precision is not None:
+            self.report.add_information("standard error", self.standard_errors)
+            self.report.add_information("rounds", self.rounds)
+        for key, data_table in self.de.data_tables.items():
+            self.report.add_information(f"data table {key}", data_table)
 
     def visualize(self):
         for index in self.prep_index:
@@ -1,5 +1,69 @@
+import os
 import copy
-from ...objects import Job, JobTable, Report
+import numpy as np
+from ...objects import Job, JobTable, Report, ResultStore
+from ...util.histogram import Histogram
+
+CLIFFORD_GATES = {
+    "H"    : np.array([[1, 1], [1, -1]])/np.sqrt(2),
+    "S"    : np.diag([1, 1j]),
+    "CNOT" : np.array([[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 0, 1], [0, 0, 1, 0]]),
+    "CZ"   : np.diag([1, 1, 1, -1]),
+}
+
+def apply_clifford_circuit(cir, gates, qubit_index):
+    """Apply gates such as ("H", 0) or ("CNOT", 0, 1), given on label positions, to the circuit"""
+    for gate in gates:
+        if len(gate) == 2:
+            cir.su2(CLIFFORD_GATES[gate[0]], target=qubit_index[gate[1]])
+        else:
+            cir.su4(CLIFFORD_GATES[gate[0]], control=qubit_index[gate[1]], target=qubit_index[gate[2]])
+
+def build_sequence(ansatz, circuit, qubit_index, condition):
+    """Copy of circuit with the prep, the ansatz and the meas of a spam condition"""
+    cir = copy.deepcopy(circuit)
+#     cir.gate("pump", 2)
+#     cir.gate("imeas", 8)
+#     cir.gate("imeas", 9)
+#     cir.qtrigger(list(cir.port_table.nodes.keys()))
+    for i, (pauli, index) in enumerate(zip(condition["prep_pauli"], condition["prep_index"])):
+        cir.prep_init(pauli, index, qubit_index[i])
+    ansatz(cir)
+    if condition.get("meas_clifford") is not None:
+        apply_clifford_circuit(cir, condition["meas_clifford"], qubit_index)
+        for i in range(len(condition["meas_pauli"])):
+            cir.meas_axis("Z", qubit_index[i])
+    else:
+        for i, pauli in enumerate(condition["meas_pauli"]):
+            cir.meas_axis(pauli, qubit_index[i])
+#     cir.qtrigger(list(cir.port_table.nodes.keys()))
+#     cir.gate("imeas", 8)
+#     cir.gate("imeas", 9)
+    cir.measurement_all()
+    return cir
+
+def attach_result_store(job_table, spam_condition_list, result_directory):
+    """Keep the results of job_table in a new ResultStore in the next free subdirectory prepare_<k> of result_directory
+
+    Stores of earlier prepare calls are kept, so their reports stay valid.
+    """
+    n = len(spam_condition_list[0]["meas_pauli"]) if spam_condition_list else 0
+    k = 0
+    while os.path.exists(os.path.join(result_directory, "prepare_{}".format(k))):
+        k += 1
+    job_table.attach(ResultStore(os.path.join(result_directory, "prepare_{}".format(k)), len(job_table.table), n))
+
+def collect_data_table(jobs, mitigation=None):
+    """Histograms of jobs by (prep_pauli, meas_pauli) and prep_index, from job.shots if there is no job.result"""
+    data_table = {}
+    for job in jobs:
+        if (job.prep_pauli, job.meas_pauli) not in data_table.keys():
+            data_table[(job.prep_pauli, job.meas_pauli)] = {}
+        histogram = Histogram.from_dict(job.result if job.result is not None else job.shots)
+        if mitigation is not None:
+            histogram = mitigation.apply(histogram)
+        data_table[(job.prep_pauli, job.meas_pauli)][job.prep_index] = histogram
+    return data_table
 
 class DirectEstimation:
     def __init__(
@@ -8,40 +72,36 @@ class DirectEstimation:
         circuit,
         qubit_index,
         spam_condition_list,
+        result_directory = None,
         ):
+        """Jobs of an ansatz measured under every spam condition
 
+        Args:
+            ansatz (function): ansatz applied to the circuit
+            circuit: circuit on which the sequences are built
+            qubit_index (list): qubit of each position of the Pauli labels
+            spam_condition_list (list): spam conditions
+            result_directory (str): directory of a ResultStore keeping the results on disk
+        """
         self.name = "DirectEstimation"
         
         self.job_table  = JobTable(name=self.name)
         for condition in spam_condition_list:
-            
-            cir = copy.deepcopy(circuit)
-#             cir.gate("pump", 2)
-#             cir.gate("imeas", 8)
-#             cir.gate("imeas", 9)
-#             cir.qtrigger(list(cir.port_table.nodes.keys()))
-            for i, (pauli, index) in enumerate(zip(condition["prep_pauli"], condition["prep_index"])):
-                cir.prep_init(pauli, index, qubit_index[i])
-            ansatz(cir)
-            for i, pauli in enumerate(condition["meas_pauli"]):
-                cir.meas_axis(pauli, qubit_index[i])
-#             cir.qtrigger(list(cir.port_table.nodes.keys()))
-#             cir.gate("imeas", 8)
-#             cir.gate("imeas", 9)
-            cir.measurement_all()
-            
-            condition["sequence"] = cir
+            condition["sequence"] = build_sequence(ansatz, circuit, qubit_index, condition)
             self.job_table.submit(Job(condition))
+        if result_directory is not None:
+            attach_result_store(self.job_table, spam_condition_list, result_directory)
 
     def execute(self, take_data):
         take_data(self.job_table)
 
-    def make_data_table(self):
-        self.data_table = {}
-        for job in self.job_table.table:
-            if (job.prep_pauli, job.meas_pauli) not in self.data_table.keys():
-                self.data_table[(job.prep_pauli, job.meas_pauli)] = {}
-            self.data_table[(job.prep_pauli, job.meas_pauli)][job.prep_index] = job.result
+    def make_data_table(self, mitigation=None):
+        """Collect the histograms by (prep_pauli, meas_pauli) and prep_index
+
+        Args:
+            mitigation (ReadoutMitigation): readout mitigation applied to every histogram
+        """
+        self.data_table = collect_data_table(self.job_table.table, mitigation)
 
     def reset(self):
         self.job_table.reset()
@@ -53,41 +113,51 @@ class MitigatedDirectEstimation(DirectEstimation):
         self,
         ansatz,
         circuits,
+        qubit_index,
         spam_condition_list,
+        seed = None,
+        result_directory = None,
         ):
+        """DirectEstimation of several circuits, e.g. noise stretch factors, in one JobTable
+
+        Every job is tagged with the key of its circuit as "stretch", and the jobs
+        are shuffled so that drifts during take_data are shared by all circuits.
 
+        Args:
+            ansatz (function): ansatz applied to each circuit
+            circuits (dict): {stretch key: circuit}
+            qubit_index (list): qubit of each position of the Pauli labels
+            spam_condition_list (list): spam conditions measured with every circuit
+            seed (int): seed of the job order
+            result_directory (str): directory of a ResultStore keeping the results on disk
+        """
         self.name = "MitigatedDirectEstimation"
-        self.job_tables = {}
+        self.keys = list(circuits.keys())
+
+        jobs = []
         for key, circuit in circuits.items():
-            job_table  = JobTable()
-            for spam_condition in spam_condition_list:
-                circuit._reset()
-                for i, (pauli, index) in enumerate(zip(spam_condition["prep_pauli"], spam_condition["prep_index"])):
-                    circuit.state_preparation(pauli, index, circuit.qubit_name_list[i])
-                ansatz(cir)
-                for i, pauli in enumerate(spam_condition["meas_pauli"]):
-                    circuit.measurement(pauli, circuit.qubit_name_list[i])
-                spam_condition["sequence"] = copy.deepcopy(circuit.base.sequence)
-                job_table.submit(Job(spam_condition))
-            self.job_tables[key] = job_table
+            for condition in spam_condition_list:
+                condition = dict(condition, stretch=key)
+                condition["sequence"] = build_sequence(ansatz, circuit, qubit_index, condition)
+                jobs.append(Job(condition))
 
-    def execute(self, take_data):
-        for job_table in self.job_tables.values():
-            take_data(job_table)
+        self.job_table = JobTable(name=self.name)
+        for position in np.random.default_rng(seed).permutation(len(jobs)):
+            self.job_table.submit(jobs[position])
+        if result_directory is not None:
+            attach_result_store(self.job_table, spam_condition_list, result_directory)
 
-    def make_data_table(self):
+    def make_data_table(self, mitigation=None):
+        """Collect the histograms of each circuit by (prep_pauli, meas_pauli) and prep_index
+
+        Args:
+            mitigation (ReadoutMitigation): readout mitigation applied to every histogram
+        """
         self.data_tables = {}
-        for key, job_table in self.job_tables.items():
-            data_table = {}
-            for job in job_table.table:
-                if (job.prep_pauli, job.meas_pauli) not in data_table.keys():
-                    data_table[(job.prep_pauli, job.meas_pauli)] = {}
-                data_table[(job.prep_pauli, job.meas_pauli)][job.prep_index] = job.result
-            self.data_tables[key] = data_table
+        for key in self.keys:
+            self.data_tables[key] = collect_data_table([job for job in self.job_table.table if job.stretch == key], mitigation)
 
     def reset(self):
-        for job_table in self.job_tables.values():
-            job_table.reset()
-        for data_table in self.data_tables.values():
-            data_table = {}
+        self.job_table.reset()
+        self.data_tables = {}
         self.report = None
@@ -1,15 +1,27 @@
 import itertools
 import numpy as np
-from .direct_estimation import DirectEstimation
+import scipy.sparse as sp
+from .direct_estimation import DirectEstimation, MitigatedDirectEstimation
 from ...objects import Report
 from ...util.pauli_expression import PauliTransferMatrix, StabilizerPauliTransferMatrix
 from ...util.visualize import show_ptm
 from ...util.indicator import average_gate_fidelity
-from ...util.histogram import expect_pauli
+from ...util.histogram import expect_pauli_pairs
+from ...util.mitigation import extrapolate
 
-def find_intercept(xdata, ydata):
-    slope, intercept = np.polyfit(xdata, ydata, 1)
-    return intercept
+def analyze_clique(ptm_target, clique_label, histograms):
+    """PTM entries of one clique of a target PTM
+
+    Args:
+        ptm_target (PauliTransferMatrix): target whose clique_dict gives the measured nodes
+        clique_label (tuple): key of ptm_target.clique_dict
+        histograms (dict): {prep_index: histogram} measured for the clique
+    Returns:
+        dict: {(prep_pauli, meas_pauli): value}
+    """
+    nodes  = [tuple(node) for node in ptm_target.clique_dict[clique_label]]
+    values = expect_pauli_pairs(nodes, histograms)/(2**ptm_target.n)
+    return dict(zip(nodes, values))
 
 class DirectFidelityEstimation:
     def __init__(
@@ -18,54 +30,158 @@ class DirectFidelityEstimation:
         stabilizer_prep,
         stabilizer_meas,
         clique_cover_strategy,
+        factorized = False,
+        precision = None,
+        failure_probability = 0.05,
+        seed = None,
         ):
 
         self.name = "DirectFidelityEstimation"
-        self.number_of_qubit = int(np.log2(gate_notation.shape[0]))
-        self.prep_index      = ["".join(i) for i in itertools.product(["0","1"],repeat=self.number_of_qubit)]
         self.ptm_target = StabilizerPauliTransferMatrix(
             gate            = gate_notation,
             stabilizer_prep = stabilizer_prep,
             stabilizer_meas = stabilizer_meas
             )
+        self.number_of_qubit = self.ptm_target.n
+        self.prep_index      = ["".join(i) for i in itertools.product(["0","1"],repeat=self.number_of_qubit)]
         self.ptm_target.calculate()
-        self.ptm_target.get_graph()
-        self.ptm_target.get_clique_dict(strategy=clique_cover_strategy)
+        self.precision = precision
+        self.failure_probability = failure_probability
+        if precision is None:
+            self.ptm_target.get_clique_dict(strategy=clique_cover_strategy, factorized=factorized)
+        else:
+            self.sample(precision, failure_probability, seed)
+            self.ptm_sampled.get_clique_dict(strategy=clique_cover_strategy, factorized=factorized)
+
+    def sample(self, precision, failure_probability, seed=None):
+        """Draw (prep, meas) pairs and prep eigenstates for importance-sampled DFE [Flammia-Liu]
+
+        Pairs k are drawn with probability R_t[k]^2/sum(R_t^2) and every copy of a draw
+        prepares a uniformly random eigenstate of the prep Pauli, so that
+        X = sign*<meas>/R_t[k] has mean E[X] = sum(R_t R_a)/sum(R_t^2) and the
+        fidelity is (2^n E[X]+1)/(2^n+1). For Clifford targets |R_t| = 1 and one copy
+        per draw is bounded by Hoeffding. Otherwise Chebyshev bounds the draw of pairs
+        and Hoeffding the copies of each pair, with half of the error and of the
+        failure probability each.
+
+        Args:
+            precision (float): half width of the confidence interval of the fidelity
+            failure_probability (float): probability that the error exceeds precision
+            seed (int): seed of the sampling
+        """
+        rng     = np.random.default_rng(seed)
+        n       = self.number_of_qubit
+        value   = self.ptm_target.value
+        epsilon = precision*(2**n+1)/2**n
+        delta   = failure_probability
+        self.clifford = bool(np.allclose(np.abs(value), 1))
+        if self.clifford:
+            self.sample_number = int(np.ceil(2*np.log(2/delta)/epsilon**2))
+        else:
+            self.sample_number = int(np.ceil(8/(epsilon**2*delta)))
+        draw = rng.choice(value.size, size=self.sample_number, p=value**2/np.dot(value, value))
+        position, count = np.unique(draw, return_counts=True)
+        if self.clifford:
+            copies = count
+        else:
+            copies = count*np.ceil(8*np.log(4/delta)/(value[position]**2*self.sample_number*epsilon**2)).astype(int)
+
+        matrix = sp.coo_matrix((value[position], (self.ptm_target.prep_index[position], self.ptm_target.meas_index[position])), shape=(4**n, 4**n))
+        self.ptm_sampled = PauliTransferMatrix.from_matrix(matrix)
+        label = self.ptm_target.label
+        self.sample_count  = {}
+        self.sample_copies = {}
+        for key, number, copy in zip(self.ptm_target.key[position], count, copies):
+            node = (label[key//4**n], label[key%4**n])
+            index, number_of_copy = np.unique(rng.integers(0, 2**n, size=copy), return_counts=True)
+            self.sample_count[node]  = int(number)
+            self.sample_copies[node] = {format(i, "0{}b".format(n)): int(c) for i, c in zip(index, number_of_copy)}
 
-    def set_circuit(self, circuits, qubit_index):
+    def set_circuit(self, circuits, qubit_index, readout_mitigation=None, result_directory=None):
         self.circuit = circuits["1"]
         self.qubit_index = qubit_index
+        self.readout_mitigation = readout_mitigation
+        self.result_directory = result_directory
 
     def prepare(self, ansatz):
         spam_condition_list = []
-        for clique_key in self.ptm_target.clique_dict.keys():
-            for index in self.prep_index:
-                spam_condition_list.append(
-                    {
-                        "prep_pauli" : clique_key[0],
-                        "meas_pauli" : clique_key[1],
-                        "prep_index" : index,
-                    }
-                )
-        self.de = DirectEstimation(ansatz, self.circuit, self.qubit_index, spam_condition_list)
+        if self.precision is None:
+            for clique_key in self.ptm_target.clique_dict.keys():
+                for index in self.prep_index:
+                    spam_condition_list.append(
+                        {
+                            "prep_pauli" : clique_key[0],
+                            "meas_pauli" : clique_key[1],
+                            "prep_index" : index,
+                        }
+                    )
+        else:
+            # one shot per copy, copies of the nodes of a clique share the shots
+            for clique_key, nodes in self.ptm_sampled.clique_dict.items():
+                shots = {}
+                for node in nodes:
+                    for index, copy in self.sample_copies[tuple(node)].items():
+                        shots[index] = max(shots.get(index, 0), copy)
+                for index, shot in shots.items():
+                    spam_condition_list.append(
+                        {
+                            "prep_pauli" : clique_key[0],
+                            "meas_pauli" : clique_key[1],
+                            "prep_index" : index,
+                            "shot"       : shot,
+                        }
+                    )
+        self.de = DirectEstimation(ansatz, self.circuit, self.qubit_index, spam_condition_list, result_directory=self.result_directory)
         self.job_table = self.de.job_table
 
     def execute(self, take_data):
         self.de.execute(take_data)
 
+    def analyze_clique(self, clique_label, histograms):
+        """PTM entries of one clique, so that results can be updated clique by clique"""
+        return analyze_clique(self.ptm_target, clique_label, histograms)
+
+    def analyze_sampled(self):
+        """Importance-sampled fidelity from the copies drawn by sample"""
+        n = self.number_of_qubit
+        ptm_ansatz = {}
+        estimate = 0
+        for clique_label, nodes in self.ptm_sampled.clique_dict.items():
+            nodes = [tuple(node) for node in nodes]
+            total = np.zeros(len(nodes))
+            for index, histogram in self.de.data_table[clique_label].items():
+                copies = np.array([self.sample_copies[node].get(index, 0) for node in nodes])
+                total += copies*expect_pauli_pairs(nodes, {index: histogram})
+            for node, value in zip(nodes, total):
+                ptm_ansatz[node] = value/sum(self.sample_copies[node].values())
+                estimate += self.sample_count[node]*ptm_ansatz[node]/self.ptm_sampled.ptm[node]
+        estimate /= self.sample_number
+
+        self.ptm_ansatz = PauliTransferMatrix(gate=None, ptm_dict=ptm_ansatz)
+        self.fidelity = (2**n*estimate+1)/(2**n+1)
+        self.confidence_interval = (self.fidelity-self.precision, self.fidelity+self.precision)
+        self.score = 1 - self.fidelity
+
+        self.report = Report(name="direct_fidelity_estimatoin")
+        self.report.add_information("score", self.score)
+        self.report.add_information("subspace average gate fidelty", self.fidelity)
+        self.report.add_information("confidence interval", self.confidence_interval)
+        self.report.add_information("confidence level", 1 - self.failure_probability)
+        self.report.add_information("number of samples", self.sample_number)
+        self.report.add_information("target pauli transfer matrix", dict(self.ptm_target.ptm))
+        self.report.add_information("ansatz pauli transfer matrix", dict(self.ptm_ansatz.ptm))
+        self.report.add_information("qubit index", self.qubit_index)
+        self.report.add_information("raw data", self.de)
+
     def analyze(self):
-        self.de.make_data_table()
+        self.de.make_data_table(mitigation=self.readout_mitigation)
+        if self.precision is not None:
+            self.analyze_sampled()
+            return
 
         ptm_ansatz = {}
-        for clique_label, clique_nodes in self.ptm_target.clique_dict.items():
-            for node in clique_nodes:
-                prep_pauli, meas_pauli = node
-                prep_histogram = {}
-                for prep_index, meas_histogram in self.de.data_table[clique_label].items():
-                    expected_value = expect_pauli(meas_pauli, meas_histogram)
-                    prep_histogram[prep_index] = expected_value
-                expected_value = expect_pauli(prep_pauli, prep_histogram)
-                ptm_ansatz[node] = expected_value/(2**self.number_of_qubit)
+        for clique_label in self.ptm_target.clique_dict.keys():
+            ptm_ansatz.update(self.analyze_clique(clique_label, self.de.data_table[clique_label]))
 
         self.ptm_ansatz = PauliTransferMatrix(gate=None, ptm_dict=ptm_ansatz)
         self.fidelity = average_gate_fidelity(self.ptm_target, self.ptm_ansatz)
@@ -74,8 +190,8 @@ class DirectFidelityEstimation:
         self.report = Report(name="direct_fidelity_estimatoin")
         self.report.add_information("score", self.score)
         self.report.add_information("subspace average gate fidelty", self.fidelity)
-        self.report.add_information("target pauli transfer matrix", self.ptm_target.ptm)
-        self.report.add_information("ansatz pauli transfer matrix", self.ptm_ansatz.ptm)
+        self.report.add_information("target pauli transfer matrix", dict(self.ptm_target.ptm))
+        self.report.add_information("ansatz pauli transfer matrix", dict(self.ptm_ansatz.ptm))
         self.report.add_information("qubit index", self.qubit_index)
         self.report.add_information("raw data", self.de)
 
@@ -94,23 +210,27 @@ class DirectFidelityEstimation2:
         stabilizer_prep,
         stabilizer_meas,
         clique_cover_strategy,
+        factorized = False,
+        extrapolation = "linear",
         ):
 
         self.name = "DirectFidelityEstimation"
-        self.number_of_qubit = int(np.log2(gate_notation.shape[0]))
-        self.prep_index      = ["".join(i) for i in itertools.product(["0","1"],repeat=self.number_of_qubit)]
         self.ptm_target = StabilizerPauliTransferMatrix(
             gate            = gate_notation,
             stabilizer_prep = stabilizer_prep,
             stabilizer_meas = stabilizer_meas
             )
+        self.number_of_qubit = self.ptm_target.n
+        self.prep_index      = ["".join(i) for i in itertools.product(["0","1"],repeat=self.number_of_qubit)]
         self.ptm_target.calculate()
-        self.ptm_target.get_graph()
-        self.ptm_target.get_clique_dict(strategy=clique_cover_strategy)
+        self.ptm_target.get_clique_dict(strategy=clique_cover_strategy, factorized=factorized)
+        self.extrapolation = extrapolation
 
-    def set_circuit(self, circuits, qubit_index):
+    def set_circuit(self, circuits, qubit_index, readout_mitigation=None, result_directory=None):
         self.circuits = circuits
         self.qubit_index = qubit_index
+        self.readout_mitigation = readout_mitigation
+        self.result_directory = result_directory
 
     def prepare(self, ansatz):
         spam_condition_list = []
@@ -123,52 +243,33 @@ class DirectFidelityEstimation2:
                         "prep_index" : index,
                     }
                 )
-        self.des = {}
-        for key, circuit in self.circuits.items():
-            self.des[key] = DirectEstimation(ansatz, circuit, self.qubit_index, spam_condition_list)
-        
         # for variational_optimization : line 19
-        self.de = self.des[1]
+        self.de = MitigatedDirectEstimation(ansatz, self.circuits, self.qubit_index, spam_condition_list, result_directory=self.result_directory)
         self.job_table = self.de.job_table
 
     def execute(self, take_data):
-        for de in self.des.values():
-            de.execute(take_data)
+        self.de.execute(take_data)
+
+    def analyze_clique(self, clique_label, histograms):
+        """PTM entries of one clique, so that results can be updated clique by clique"""
+        return analyze_clique(self.ptm_target, clique_label, histograms)
 
     def analyze(self):
-        for de in self.des.values():
-            de.make_data_table()
+        self.de.make_data_table(mitigation=self.readout_mitigation)
 
         ptm_ansatzs = {}
-        for key, de in self.des.items():
+        for key, data_table in self.de.data_tables.items():
             ptm_ansatzs[key] = {}
-            for clique_label, clique_nodes in self.ptm_target.clique_dict.items():
-                for node in clique_nodes:
-                    prep_pauli, meas_pauli = node
-                    prep_histogram = {}
-                    for prep_index, meas_histogram in de.data_table[clique_label].items():
-                        expected_value = expect_pauli(meas_pauli, meas_histogram)
-                        prep_histogram[prep_index] = expected_value
-                    expected_value = expect_pauli(prep_pauli, prep_histogram)
-                    ptm_ansatzs[key][node] = expected_value/(2**self.number_of_qubit)
+            for clique_label in self.ptm_target.clique_dict.keys():
+                ptm_ansatzs[key].update(self.analyze_clique(clique_label, data_table[clique_label]))
         
-        if len(self.des) != 1:
-            ptm_ansatzs[0] = {}
-            for clique_label, clique_nodes in self.ptm_target.clique_dict.items():
-                for node in clique_nodes:
-                    xdata = []
-                    ydata = []
-                    for key in self.des.keys():
-                        xdata.append(key)
-                        ydata.append(ptm_ansatzs[key][node])
-                    intercept = find_intercept(xdata, ydata)
-                    if intercept < -1:
-                        intercept = -1
-                    elif intercept > +1:
-                        intercept = +1
-                    ptm_ansatzs[0][node] = intercept
+        if len(self.de.keys) != 1:
+            nodes  = list(ptm_ansatzs[self.de.keys[0]].keys())
+            values = np.array([[ptm_ansatzs[key][node] for node in nodes] for key in self.de.keys])
+            intercepts = extrapolate(self.de.keys, values, model=self.extrapolation)
+            ptm_ansatzs[0] = dict(zip(nodes, intercepts))
         else:
-            ptm_ansatzs[0] = ptm_ansatzs[list(self.des.keys())[0]]
+            ptm_ansatzs[0] = ptm_ansatzs[self.de.keys[0]]
 
         self.ptm_ansatzs = {}
         for key, ptm_ansatz in ptm_ansatzs.items():
@@ -180,12 +281,12 @@ class DirectFidelityEstimation2:
         self.report = Report(name="direct_fidelity_estimatoin")
         self.report.add_information("score", self.score)
         self.report.add_information("subspace average gate fidelty", self.fidelity)
-        self.report.add_information("target pauli transfer matrix", self.ptm_target.ptm)
+        self.report.add_information("target pauli transfer matrix", dict(self.ptm_target.ptm))
         for key, ptm_ansatz in self.ptm_ansatzs.items():
-            self.report.add_information(f"ansatz pauli transfer matrix {key}", ptm_ansatz.ptm)
+            self.report.add_information(f"ansatz pauli transfer matrix {key}", dict(ptm_ansatz.ptm))
         self.report.add_information("qubit index", self.qubit_index)
-        for key, val in self.des.items():
-            self.report.add_information(f"data table {key}", val.data_table)
+        for key, data_table in self.de.data_tables.items():
+            self.report.add_information(f"data table {key}", data_table)
 
     def visualize(self):
         print("Subspace averaged gate fidelity")
@@ -1,20 +1,25 @@
 import itertools
 import numpy as np
-from .direct_estimation import DirectEstimation
+from .direct_estimation import MitigatedDirectEstimation
 from ...objects import Report
+from ...util.tomography import linear_inversion_state, maximum_likelihood_state
 
 class QuantumStateTomography:
     def __init__(
         self,
-        number_of_qubit
+        number_of_qubit,
+        method = "maximum_likelihood",
         ):
 
         self.name = "QuantumStateTomography"
         self.number_of_qubit = number_of_qubit
+        self.method = method
 
-    def set_circuit(self, circuits, qubit_index):
+    def set_circuit(self, circuits, qubit_index, readout_mitigation=None, result_directory=None):
         self.circuits = circuits
         self.qubit_index = qubit_index
+        self.readout_mitigation = readout_mitigation
+        self.result_directory = result_directory
 
     def prepare(self, ansatz):
         spam_condition_list = []
@@ -33,21 +38,24 @@ class QuantumStateTomography:
                 }
             )
                 
-        self.des = {}
-        for key, circuit in self.circuits.items():
-            self.des[key] = DirectEstimation(ansatz, circuit, self.qubit_index, spam_condition_list)
+        self.de = MitigatedDirectEstimation(ansatz, self.circuits, self.qubit_index, spam_condition_list, result_directory=self.result_directory)
+        self.job_table = self.de.job_table
 
     def execute(self, take_data):
-        for de in self.des.values():
-            de.execute(take_data)
+        self.de.execute(take_data)
 
     def analyze(self):
-        for de in self.des.values():
-            de.make_data_table()
+        self.de.make_data_table(mitigation=self.readout_mitigation)
+
+        reconstruct = {"linear_inversion" : linear_inversion_state, "maximum_likelihood" : maximum_likelihood_state}[self.method]
+        self.density_matrix = {}
+        for key, data_table in self.de.data_tables.items():
+            self.density_matrix[key] = reconstruct(data_table)
 
         self.report = Report(name="quantum_state_tomography")
-        for key, val in self.des.items():
-            self.report.add_information(f"data table {key}", val.data_table)
+        self.report.add_information("density matrix", self.density_matrix)
+        for key, data_table in self.de.data_tables.items():
+            self.report.add_information(f"data table {key}", data_table)
 
     def visualize(self):
         print(self.report.name)
\ No newline at end of file
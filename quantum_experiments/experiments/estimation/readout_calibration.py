@@ -0,0 +1,62 @@
+import numpy as np
+from .direct_estimation import DirectEstimation
+from ...objects import Report
+from ...util.mitigation import ReadoutMitigation
+
+class ReadoutCalibration:
+    def __init__(
+        self,
+        number_of_qubit,
+        blocks = None,
+        ):
+
+        self.name = "ReadoutCalibration"
+        self.number_of_qubit = number_of_qubit
+        self.blocks = [(qubit,) for qubit in range(number_of_qubit)] if blocks is None else [tuple(block) for block in blocks]
+        # pattern p prepares the k lowest bits of p on every block of k qubits
+        block_size = max(len(block) for block in self.blocks)
+        self.prep_index = []
+        for pattern in range(2**block_size):
+            bits = ["0"]*number_of_qubit
+            for block in self.blocks:
+                for position, qubit in enumerate(block):
+                    bits[qubit] = str(pattern >> (len(block)-position-1) & 1)
+            self.prep_index.append("".join(bits))
+
+    def set_circuit(self, circuits, qubit_index, result_directory=None):
+        self.circuit = list(circuits.values())[0]
+        self.qubit_index = qubit_index
+        self.result_directory = result_directory
+
+    def prepare(self, ansatz=lambda cir: None):
+        spam_condition_list = []
+        for index in self.prep_index:
+            spam_condition_list.append(
+                {
+                    "prep_pauli" : "I"*self.number_of_qubit,
+                    "meas_pauli" : "Z"*self.number_of_qubit,
+                    "prep_index" : index,
+                }
+            )
+        self.de = DirectEstimation(ansatz, self.circuit, self.qubit_index, spam_condition_list, result_directory=self.result_directory)
+        self.job_table = self.de.job_table
+
+    def execute(self, take_data):
+        self.de.execute(take_data)
+
+    def analyze(self):
+        self.de.make_data_table()
+        self.readout_mitigation = ReadoutMitigation.from_histograms(
+            self.de.data_table[("I"*self.number_of_qubit, "Z"*self.number_of_qubit)],
+            blocks = self.blocks,
+            )
+
+        self.report = Report(name="readout_calibration")
+        self.report.add_information("assignment matrix", dict(zip(self.blocks, self.readout_mitigation.assignment)))
+        self.report.add_information("qubit index", self.qubit_index)
+        self.report.add_information("data table", self.de.data_table)
+
+    def visualize(self):
+        for block, matrix in zip(self.blocks, self.readout_mitigation.assignment):
+            print(f"Qubits {[self.qubit_index[qubit] for qubit in block]}")
+            print(np.round(matrix, 4))
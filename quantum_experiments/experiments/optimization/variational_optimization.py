@@ -4,19 +4,29 @@ from ...objects import Stepper, Report
 from ...optimizer import optimizer
 
 class VariationalOptimization:
-    def __init__(self, direct_x_estimation):
+    def __init__(self, direct_x_estimation, precision_schedule=None):
+        """Variational optimization of the score of an estimation experiment
+
+        Args:
+            direct_x_estimation: experiment with prepare, execute and analyze, e.g. DirectEnergyEstimation
+            precision_schedule (function): iteration number -> stopping_precision of the experiment,
+                decreasing to tighten the standard error as the optimization converges
+        """
         self.dxe = direct_x_estimation
+        self.precision_schedule = precision_schedule
 
     def prepare(self, ansatz, take_data, n_param):
         def sub_execute(phi):
             tmp_ansatz = lambda cir : ansatz(cir, phi=phi)
+            if self.precision_schedule is not None:
+                self.dxe.stopping_precision = self.precision_schedule(len(self.stepper.iteration))
             self.dxe.prepare(tmp_ansatz)
             self.dxe.execute(take_data)
             self.dxe.analyze()
 
             sub_report = {}
             sub_report["score"] = self.dxe.report.dictionary["score"]
-            sub_report["step"] = len(self.dxe.de.job_table.table)
+            sub_report["step"] = len(self.dxe.de.job_table.table)*getattr(self.dxe, "rounds", 1)
             sub_report["register"] = {}
             for key, value in self.dxe.report.dictionary.items():
                 if key != "score":
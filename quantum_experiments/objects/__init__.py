@@ -1,3 +1,4 @@
 from .report import Report
 from .table import Job, JobTable
-from .stepper import Stepper
\ No newline at end of file
+from .stepper import Stepper
+from .result_store import ResultStore
\ No newline at end of file
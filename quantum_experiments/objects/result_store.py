@@ -0,0 +1,153 @@
+import os
+import json
+import numpy as np
+from ..util.histogram import Histogram
+
+DENSE_LIMIT = 2**12
+
+class ResultStore:
+    def __init__(self, path, number_of_job, n, dense=None, capacity=None):
+        """Histograms of a JobTable kept in memory-mapped files of the directory path
+
+        Dense stores hold a (number_of_job, 2^n) array of values. Sparse stores
+        append the (outcome, value) pairs of each result to growing arrays and keep
+        the start and length of each job, like the rows of a CSR matrix. Rewriting a
+        job reuses its slot when the new result fits, and a result which does not fit
+        moves to a new slot of twice its size, or extends its slot in place if it is
+        the last one, so repeated rewrites of growing results leave little dead
+        space. Every write goes to the mapped files, so memory use does not grow with
+        the number of jobs and the results written so far are kept if the process dies.
+
+        Args:
+            path (str): directory of the store, created if needed, which must not hold a store
+            number_of_job (int): number of jobs
+            n (int): number of measured qubits
+            dense (bool): dense store, by default if 2^n <= DENSE_LIMIT
+            capacity (int): initial number of sparse entries, doubled when full
+        """
+        self.path = path
+        if os.path.exists(os.path.join(path, "meta.json")):
+            raise FileExistsError("{} already holds a store, use ResultStore.open".format(path))
+        os.makedirs(path, exist_ok=True)
+        self.meta = {
+            "number_of_job" : number_of_job,
+            "n"             : n,
+            "dense"         : 2**n <= DENSE_LIMIT if dense is None else dense,
+            "capacity"      : capacity or 16*number_of_job,
+        }
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(self.meta, f)
+        self._map("w+")
+
+    @classmethod
+    def open(cls, path):
+        """Reopen an existing store, e.g. after a crash or when unpickled"""
+        store = cls.__new__(cls)
+        store.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            store.meta = json.load(f)
+        store._map("r+")
+        return store
+
+    def _file(self, name, dtype, shape, mode):
+        return np.memmap(os.path.join(self.path, name + ".dat"), dtype=dtype, mode=mode, shape=shape)
+
+    def _map(self, mode):
+        jobs = self.meta["number_of_job"]
+        self.written = self._file("written", np.bool_, (jobs,), mode)
+        if self.meta["dense"]:
+            self.counts = self._file("counts", np.float64, (jobs, 2**self.meta["n"]), mode)
+            return
+        self.start  = self._file("start", np.int64, (jobs,), mode)
+        self.length = self._file("length", np.int64, (jobs,), mode)
+        self.slot   = self._file("slot", np.int64, (jobs,), mode)
+        self.size   = self._file("size", np.int64, (1,), mode)
+        self._map_entries(mode)
+
+    def _map_entries(self, mode):
+        capacity   = self.meta["capacity"]
+        self.index = self._file("index", np.int64, (capacity,), mode)
+        self.count = self._file("count", np.float64, (capacity,), mode)
+
+    def _grow(self, size):
+        self.index.flush()
+        self.count.flush()
+        capacity = self.meta["capacity"]
+        while capacity < size:
+            capacity *= 2
+        for name, dtype in (("index", np.int64), ("count", np.float64)):
+            with open(os.path.join(self.path, name + ".dat"), "r+b") as f:
+                f.truncate(capacity*np.dtype(dtype).itemsize)
+        self.meta["capacity"] = capacity
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(self.meta, f)
+        self._map_entries("r+")
+
+    @property
+    def n(self):
+        return self.meta["n"]
+
+    def __len__(self):
+        return self.meta["number_of_job"]
+
+    def write(self, job, histogram):
+        """Store the result of a job
+
+        Args:
+            job (int): position of the job
+            histogram (dict): histogram such as {"00": 0.5, "11": 0.5}, Histogram or Shots
+        """
+        histogram = Histogram.from_dict(histogram)
+        if histogram.n != self.n:
+            raise ValueError("result of {} qubits in a store of {} qubits".format(histogram.n, self.n))
+        if self.meta["dense"]:
+            self.counts[job] = histogram.to_dense().count
+        else:
+            histogram = histogram.to_sparse()
+            length = histogram.index.size
+            start  = int(self.start[job])
+            if not self.written[job] or length > self.slot[job]:
+                if self.written[job] and start + self.slot[job] == self.size[0]:
+                    # the last slot grows in place
+                    slot = 2*length
+                else:
+                    start, slot = int(self.size[0]), length if not self.written[job] else 2*length
+                if start + slot > self.meta["capacity"]:
+                    self._grow(start + slot)
+                self.start[job] = start
+                self.slot[job]  = slot
+                self.size[0]    = start + slot
+            self.index[start:start+length] = histogram.index
+            self.count[start:start+length] = histogram.count
+            self.length[job] = length
+        self.written[job] = True
+
+    def read(self, job, copy=True):
+        """Histogram of a job, None if not written
+
+        Args:
+            job (int): position of the job
+            copy (bool): copy the arrays, otherwise they are views of the mapped files
+                which change when the job is written again
+        Returns:
+            Histogram: result of the job
+        """
+        if not self.written[job]:
+            return None
+        if self.meta["dense"]:
+            return Histogram(self.n, dense=np.array(self.counts[job], copy=copy))
+        start, stop = self.start[job], self.start[job] + self.length[job]
+        return Histogram(self.n, index=np.array(self.index[start:stop], copy=copy), count=np.array(self.count[start:stop], copy=copy))
+
+    def flush(self):
+        for array in vars(self).values():
+            if isinstance(array, np.memmap):
+                array.flush()
+
+    def __getstate__(self):
+        # pickled by reference, the data stay in the files
+        self.flush()
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__dict__.update(ResultStore.open(state["path"]).__dict__)
@@ -1,10 +1,38 @@
 class Job:
+    store       = None
+    store_index = None
+    _result     = None
+
     def __init__(self, conditions):
+        self.store      = None
         self.result     = None
+        self.shots      = None
         self.end_flag   = False
         self.__dict__.update(conditions)
 
+    @property
+    def result(self):
+        """Result histogram, read from the ResultStore when the job is attached to one"""
+        if self.store is not None:
+            return self.store.read(self.store_index)
+        return self._result
+
+    @result.setter
+    def result(self, histogram):
+        if self.store is not None and histogram is not None:
+            self.store.write(self.store_index, histogram)
+        else:
+            self._result = histogram
+
+    def __setstate__(self, state):
+        # jobs pickled before the result property kept it in result
+        if "result" in state:
+            state["_result"] = state.pop("result")
+        self.__dict__.update(state)
+
 class JobTable:
+    store = None
+
     def __init__(self, name=None):
         self.reset()
         self.name = name
@@ -12,5 +40,24 @@ class JobTable:
     def submit(self, job):
         self.table.append(job)
 
+    def attach(self, store):
+        """Keep the results of the jobs in a ResultStore
+
+        Results already taken are moved into the store, and later results are
+        written to it as take_data sets job.result.
+
+        Args:
+            store (ResultStore): store with one row per job of the table
+        """
+        if len(store) < len(self.table):
+            raise ValueError("store of {} jobs for a table of {} jobs".format(len(store), len(self.table)))
+        for position, job in enumerate(self.table):
+            result = job.result
+            job.store, job.store_index, job._result = store, position, None
+            if result is not None:
+                job.result = result
+        self.store = store
+
     def reset(self):
         self.table  = []
+        self.store  = None
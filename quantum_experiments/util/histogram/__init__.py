@@ -1 +1,3 @@
-from .integrate import expect_pauli
\ No newline at end of file
+from .integrate import expect_pauli, expect_paulis, expect_pauli_pairs, variance_pauli_sum, covariance_paulis
+from .histogram import Histogram
+from .shots import Shots
\ No newline at end of file
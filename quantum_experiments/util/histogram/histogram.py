@@ -0,0 +1,142 @@
+from collections.abc import Mapping
+import numpy as np
+from ..pauli_expression.symplectic import walsh_hadamard
+
+# outcomes and masks are packed into non-negative int64
+MAX_QUBITS = 62
+
+def check_qubits(n):
+    if n > MAX_QUBITS:
+        raise ValueError("Histogram supports up to {} qubits, got {}".format(MAX_QUBITS, n))
+
+def parity(array):
+    """Parity of the number of set bits of each element of a non-negative integer array"""
+    array = np.array(array, dtype=np.int64).astype(np.uint64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        array ^= array >> np.uint64(shift)
+    return (array & np.uint64(1)).astype(bool)
+
+def pauli_mask(pauli):
+    """Bitmask of the non-identity qubits of a Pauli label, qubit 0 being the most significant bit"""
+    check_qubits(len(pauli))
+    return int("".join("0" if p == "I" else "1" for p in pauli), 2) if pauli else 0
+
+class Histogram(Mapping):
+    def __init__(self, n, index=None, count=None, dense=None):
+        """Measurement outcomes of n qubits stored as arrays
+
+        The outcome bitstring b_0 b_1 ... b_{n-1} is stored as the integer with b_0
+        as the most significant bit. Either sparse (index, count) arrays or a dense
+        array of length 2^n indexed by the outcome is given. Values are used as is,
+        so they are probabilities for the histograms of take_data.
+
+        Args:
+            n (int): number of measured qubits
+            index (np.ndarray): outcome integers of the sparse form
+            count (np.ndarray): values of each outcome of the sparse form
+            dense (np.ndarray): values of all the 2^n outcomes
+        """
+        check_qubits(n)
+        self.n = n
+        if dense is not None:
+            self.index = None
+            self.count = np.asarray(dense, dtype=float)
+        else:
+            self.index = np.asarray(index, dtype=np.int64)
+            self.count = np.asarray(count, dtype=float)
+
+    @classmethod
+    def from_dict(cls, histogram, dense=False):
+        """Convert a {bitstring: value} histogram
+
+        Args:
+            histogram (dict): histogram such as {"00": 0.5, "11": 0.5}, Histogram or Shots
+            dense (bool): store as a dense array
+        Returns:
+            Histogram: histogram
+        """
+        from .shots import Shots
+        if isinstance(histogram, Shots):
+            histogram = histogram.histogram
+        if isinstance(histogram, Histogram):
+            return histogram.to_dense() if dense else histogram
+        keys  = list(histogram.keys())
+        n     = len(keys[0]) if keys else 0
+        check_qubits(n)
+        count = np.fromiter(histogram.values(), dtype=float, count=len(keys))
+        if n:
+            bits  = np.frombuffer("".join(keys).encode(), dtype=np.uint8).reshape(len(keys), n) == ord("1")
+            index = bits@(1 << np.arange(n-1, -1, -1, dtype=np.int64))
+        else:
+            index = np.zeros(len(keys), dtype=np.int64)
+        order = np.argsort(index, kind="stable")
+        result = cls(n, index=index[order], count=count[order])
+        return result.to_dense() if dense else result
+
+    @property
+    def is_dense(self):
+        return self.index is None
+
+    @property
+    def outcomes(self):
+        """Outcome integer of each stored value"""
+        return np.arange(2**self.n, dtype=np.int64) if self.is_dense else self.index
+
+    @property
+    def total(self):
+        return self.count.sum()
+
+    def to_dense(self):
+        if self.is_dense:
+            return self
+        dense = np.zeros(2**self.n)
+        np.add.at(dense, self.index, self.count)
+        return Histogram(self.n, dense=dense)
+
+    def to_sparse(self):
+        if not self.is_dense:
+            return self
+        index = np.flatnonzero(self.count)
+        return Histogram(self.n, index=index, count=self.count[index])
+
+    def normalized(self):
+        """Histogram divided by its total"""
+        return Histogram(self.n, index=self.index, count=self.count/self.total) if not self.is_dense else Histogram(self.n, dense=self.count/self.total)
+
+    def parities(self):
+        """Expectation of the Z-parity of every subset of qubits with one Walsh-Hadamard transform
+
+        Returns:
+            np.ndarray: array of length 2^n, whose element at pauli_mask(pauli) is expect(pauli)
+        """
+        return walsh_hadamard(self.to_dense().count)
+
+    def parity(self, mask):
+        """+1/-1 for each stored outcome, -1 where an odd number of the masked bits are 1"""
+        return 1 - 2*parity(self.outcomes & mask).astype(int)
+
+    def expect(self, pauli):
+        """Sum of the values weighted by the Z-parity of the non-identity qubits of pauli"""
+        return float(np.dot(self.count, self.parity(pauli_mask(pauli))))
+
+    def _key(self, outcome):
+        return format(outcome, "0{}b".format(self.n)) if self.n else ""
+
+    def __getitem__(self, key):
+        outcome = int(key, 2) if key else 0
+        if self.is_dense:
+            return self.count[outcome]
+        position = np.searchsorted(self.index, outcome)
+        if position == len(self.index) or self.index[position] != outcome:
+            raise KeyError(key)
+        return self.count[position]
+
+    def __iter__(self):
+        for outcome in self.outcomes:
+            yield self._key(outcome)
+
+    def __len__(self):
+        return len(self.count)
+
+    def __repr__(self):
+        return "Histogram({})".format(dict(self.items()))
@@ -1,28 +1,119 @@
-import re
+import numpy as np
+from .histogram import Histogram, pauli_mask, parity, MAX_QUBITS
+
+BLOCK_SIZE = 64
+
+def _is_wide(histogram):
+    """True for a dict histogram whose outcomes do not fit in a Histogram"""
+    return isinstance(histogram, dict) and len(next(iter(histogram), "")) > MAX_QUBITS
+
+def _expect_paulis_bits(paulis, histogram):
+    """expect_paulis of a dict histogram of any number of qubits, on boolean bit arrays"""
+    keys  = list(histogram.keys())
+    count = np.fromiter(histogram.values(), dtype=float, count=len(keys))
+    bits  = np.frombuffer("".join(keys).encode(), dtype=np.uint8).reshape(len(keys), len(keys[0])) == ord("1")
+    masks = np.array([[p != "I" for p in pauli] for pauli in paulis], dtype=np.int64)
+    signs = 1 - 2*((masks@bits.T.astype(np.int64)) % 2)
+    return signs@count
 
 def expect_pauli(pauli, histogram):
-    remove_idx = find_identity(pauli)
-    expected_value = integrate_histogram(remove_idx, histogram)
-    return expected_value
-
-def find_identity(pauli):
-    return [i.start() for i in re.finditer("I",pauli)]
-
-def integrate_histogram(remove_idx, histogram):
-    expected_value = 0
-    for key, val in histogram.items():
-        coeff = count_one(key,remove_idx)
-        expected_value += coeff*val
-    return expected_value
-
-def count_one(key,remove_idx):
-    count = 0
-    for idx, string in enumerate(key):
-        if idx not in remove_idx:
-            if string is "1":
-                count += 1
-    if count%2:
-        coeff = -1
-    else:
-        coeff = +1
-    return coeff
+    """Expectation value of the Z-type parity of the non-identity qubits of pauli
+
+    Args:
+        pauli (str): Pauli label, only the positions of "I" matter
+        histogram (Histogram or dict): histogram such as {"01": 0.5, "10": 0.5}
+    Returns:
+        float: sum of the histogram values weighted by +1/-1
+    """
+    if _is_wide(histogram):
+        return float(_expect_paulis_bits([pauli], histogram)[0])
+    return Histogram.from_dict(histogram).expect(pauli)
+
+def expect_paulis(paulis, histogram):
+    """Expectation values of several Paulis read from the same histogram
+
+    Uses the all-parities transform of the histogram, O(n 2^n), when it is cheaper
+    than evaluating each Pauli on each stored outcome, O(len(paulis) * outcomes).
+    dict histograms of more than MAX_QUBITS qubits are evaluated on bit arrays.
+
+    Args:
+        paulis (list): Pauli labels, only the positions of "I" matter
+        histogram (Histogram or dict): histogram such as {"01": 0.5, "10": 0.5}
+    Returns:
+        np.ndarray: expectation value of each Pauli
+    """
+    if _is_wide(histogram):
+        return _expect_paulis_bits(paulis, histogram)
+    histogram = Histogram.from_dict(histogram)
+    masks     = np.array([pauli_mask(pauli) for pauli in paulis], dtype=np.int64)
+    if histogram.n*2**histogram.n <= len(masks)*len(histogram):
+        return histogram.parities()[masks]
+    values = np.empty(len(masks))
+    for start in range(0, len(masks), BLOCK_SIZE):
+        signs = 1 - 2*parity(masks[start:start+BLOCK_SIZE, None] & histogram.outcomes[None, :]).astype(int)
+        values[start:start+BLOCK_SIZE] = signs@histogram.count
+    return values
+
+def expect_pauli_pairs(pairs, histograms):
+    """Expectation values of (prep, meas) Pauli pairs from histograms keyed by the prepared bitstring
+
+    value = sum_{i, c} (-1)^|i & prep| histograms[i][c] (-1)^|c & meas| is evaluated for all
+    the pairs at once as prep-parity matrix @ (prep index x outcome) count matrix, contracted
+    with the meas-parity matrix.
+
+    Args:
+        pairs (list): list of (prep_pauli, meas_pauli), only the positions of "I" matter
+        histograms (dict): {prep_index: Histogram or dict}, such as {"0": {"0": 1.0}, "1": {"1": 1.0}}
+    Returns:
+        np.ndarray: expectation value of each pair
+    """
+    histograms = {index: Histogram.from_dict(histogram) for index, histogram in histograms.items()}
+    outcomes   = np.unique(np.concatenate([histogram.outcomes for histogram in histograms.values()]))
+    counts     = np.zeros((len(histograms), len(outcomes)))
+    for row, histogram in enumerate(histograms.values()):
+        counts[row, np.searchsorted(outcomes, histogram.outcomes)] = histogram.count
+    prep_index = np.array([int(index, 2) if index else 0 for index in histograms.keys()], dtype=np.int64)
+    prep_masks = np.array([pauli_mask(prep) for prep, _ in pairs], dtype=np.int64)
+    meas_masks = np.array([pauli_mask(meas) for _, meas in pairs], dtype=np.int64)
+    prep_signs = 1 - 2*parity(prep_masks[:, None] & prep_index[None, :]).astype(int)
+    meas_signs = 1 - 2*parity(meas_masks[:, None] & outcomes[None, :]).astype(int)
+    return np.sum((prep_signs@counts)*meas_signs, axis=1)
+
+def variance_pauli_sum(paulis, coefficients, histogram):
+    """Single-shot variance of sum_i coefficients[i] * (Z-type parity of paulis[i]) over a histogram
+
+    Args:
+        paulis (list): Pauli labels, only the positions of "I" matter
+        coefficients (list): real coefficient of each Pauli
+        histogram (Histogram or dict): histogram such as {"01": 0.5, "10": 0.5}
+    Returns:
+        float: variance of the sum for one outcome drawn from the normalized histogram
+    """
+    histogram = Histogram.from_dict(histogram).to_sparse()
+    masks     = np.array([pauli_mask(pauli) for pauli in paulis], dtype=np.int64)
+    values    = np.zeros(len(histogram))
+    for start in range(0, len(masks), BLOCK_SIZE):
+        signs = 1 - 2*parity(masks[start:start+BLOCK_SIZE, None] & histogram.outcomes[None, :]).astype(int)
+        values += np.asarray(coefficients[start:start+BLOCK_SIZE], dtype=float)@signs
+    weight = histogram.count/histogram.total
+    mean   = np.dot(weight, values)
+    return float(max(np.dot(weight, values**2) - mean**2, 0))
+
+def covariance_paulis(paulis, histogram):
+    """Single-shot covariance matrix of the Z-type parities of several Paulis
+
+    Cov[i, j] = <P_i P_j> - <P_i><P_j> is evaluated as signs @ diag(weight) @ signs^T
+    over the stored outcomes, so the variance of any sum of the Paulis is c^T Cov c.
+
+    Args:
+        paulis (list): Pauli labels, only the positions of "I" matter
+        histogram (Histogram or dict): histogram such as {"01": 0.5, "10": 0.5}
+    Returns:
+        np.ndarray: (len(paulis), len(paulis)) covariance for one outcome drawn from the normalized histogram
+    """
+    histogram = Histogram.from_dict(histogram).to_sparse()
+    masks     = np.array([pauli_mask(pauli) for pauli in paulis], dtype=np.int64)
+    signs     = 1 - 2*parity(masks[:, None] & histogram.outcomes[None, :]).astype(int)
+    weight    = histogram.count/histogram.total
+    mean      = signs@weight
+    return (signs*weight)@signs.T - np.outer(mean, mean)
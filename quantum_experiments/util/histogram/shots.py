@@ -0,0 +1,98 @@
+import numpy as np
+from .histogram import Histogram
+from ..pauli_expression.symplectic import POPCOUNT
+
+class Shots:
+    def __init__(self, n, packed):
+        """Single-shot outcomes of n qubits stored as bit-packed rows
+
+        Row s is np.packbits of the outcome bits b_0 b_1 ... b_{n-1} of shot s, so
+        qubit 0 is the most significant bit of the first byte as in Histogram.
+
+        Args:
+            n (int): number of measured qubits
+            packed (np.ndarray): uint8 array with shape (shots, ceil(n/8))
+        """
+        self.n          = n
+        self.packed     = np.asarray(packed, dtype=np.uint8).reshape(-1, (n+7)//8)
+        self._histogram = None
+
+    @classmethod
+    def from_bits(cls, bits):
+        """Create from a boolean (shots, n) array"""
+        bits = np.asarray(bits, dtype=bool)
+        return cls(bits.shape[1], np.packbits(bits, axis=1))
+
+    @classmethod
+    def from_strings(cls, strings):
+        """Create from outcome bitstrings such as ["010", "111"]"""
+        strings = list(strings)
+        n    = len(strings[0])
+        bits = np.frombuffer("".join(strings).encode(), dtype=np.uint8).reshape(len(strings), n) == ord("1")
+        return cls.from_bits(bits)
+
+    @property
+    def shots(self):
+        return self.packed.shape[0]
+
+    def __len__(self):
+        return self.shots
+
+    def bits(self):
+        """Boolean (shots, n) array of the outcome bits"""
+        return np.unpackbits(self.packed, axis=1, count=self.n).astype(bool)
+
+    def outcomes(self):
+        """Outcome integer of each shot, qubit 0 being the most significant bit"""
+        if self.n > 63:
+            raise ValueError("outcome integers need n <= 63, got {}".format(self.n))
+        padded = np.zeros((self.shots, 8), dtype=np.uint8)
+        padded[:, :self.packed.shape[1]] = self.packed
+        return (padded.view(">u8")[:, 0] >> np.uint64(64 - self.n)).astype(np.int64) if self.n else np.zeros(self.shots, dtype=np.int64)
+
+    @property
+    def histogram(self):
+        """Histogram of the outcome frequencies, computed on first use"""
+        if self._histogram is None:
+            index, count = np.unique(self.outcomes(), return_counts=True)
+            self._histogram = Histogram(self.n, index=index, count=count/self.shots)
+        return self._histogram
+
+    def marginal(self, qubits):
+        """Shots of the given qubit positions, in the given order
+
+        Args:
+            qubits (list): positions of the outcome bits to keep
+        Returns:
+            Shots: marginal shots
+        """
+        return Shots.from_bits(self.bits()[:, list(qubits)])
+
+    def parity(self, pauli):
+        """+1/-1 for each shot, -1 where an odd number of the non-identity qubits of pauli are 1
+
+        Args:
+            pauli (str): Pauli label, only the positions of "I" matter
+        Returns:
+            np.ndarray: array of length shots
+        """
+        mask = np.packbits([p != "I" for p in pauli])
+        return 1 - 2*(POPCOUNT[self.packed & mask].sum(axis=1) % 2).astype(int)
+
+    def expect(self, pauli):
+        """Mean of parity(pauli) over the shots"""
+        return float(np.mean(self.parity(pauli)))
+
+    def bootstrap(self, seed=None):
+        """Shots resampled with replacement
+
+        Args:
+            seed (int or np.random.Generator): seed of the resampling
+        Returns:
+            Shots: shots of the same size
+        """
+        rng = np.random.default_rng(seed)
+        return Shots(self.n, self.packed[rng.integers(0, self.shots, size=self.shots)])
+
+    def __repr__(self):
+        return "Shots(n={}, shots={})".format(self.n, self.shots)
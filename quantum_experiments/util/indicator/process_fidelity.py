@@ -5,9 +5,7 @@ def average_gate_fidelity(ptm_target, ptm_ansatz):
         raise
     else:
         n = ptm_target.n
-    inner_prod  = 0
-    for node in ptm_target.ptm.keys():
-        inner_prod += ptm_target.ptm[node]*ptm_ansatz.ptm[node]
-    inner_prod *= 4**n/np.sum(np.abs(list(ptm_target.ptm.values()))**2) # Normalization
+    inner_prod  = np.dot(ptm_target.value, ptm_ansatz.lookup(ptm_target.key))
+    inner_prod *= 4**n/np.dot(ptm_target.value, ptm_target.value) # Normalization
     fidelity    = (inner_prod/(2**n)+1)/(1+2**n)
     return fidelity
\ No newline at end of file
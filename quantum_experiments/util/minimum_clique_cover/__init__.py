@@ -1 +1 @@
-from .clique_cover import clique_cover
\ No newline at end of file
+from .clique_cover import clique_cover, graph_from_adjacency
\ No newline at end of file
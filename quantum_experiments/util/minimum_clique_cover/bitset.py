@@ -0,0 +1,144 @@
+"""Greedy clique cover on bit-packed adjacency matrices
+
+Row v of a packed adjacency is np.packbits of the neighbors of node v, so node u
+is bit 7-(u%8) of byte u//8. A clique is grown by keeping the bitwise AND of the
+rows of its members, i.e. the set of nodes that can still join it. Coloring the
+complement graph is equivalent to covering the graph with cliques, so the
+coloring orders below are expressed with complement degrees.
+"""
+import numpy as np
+
+def pack_adjacency(adjacency: np.ndarray) -> np.ndarray:
+    """Pack a boolean adjacency matrix into bit rows
+
+    Args:
+        adjacency (np.ndarray): boolean (N, N) symmetric matrix, the diagonal is ignored
+    Returns:
+        np.ndarray: uint8 array with shape (N, ceil(N/8))
+    """
+    adjacency = np.array(adjacency, dtype=bool)
+    np.fill_diagonal(adjacency, False)
+    return np.packbits(adjacency, axis=1)
+
+def _unpack(row: np.ndarray, size: int) -> np.ndarray:
+    return np.unpackbits(row, count=size).astype(bool)
+
+def _cliques(color: np.ndarray) -> list:
+    """Convert a clique index of each node into lists of node indices"""
+    order = np.argsort(color, kind="stable")
+    split = np.flatnonzero(np.diff(color[order])) + 1
+    return [clique.tolist() for clique in np.split(order, split)] if color.size else []
+
+def greedy_cover(packed: np.ndarray, order) -> list:
+    """Put each node into the first clique it can join, in the given order
+
+    Args:
+        packed (np.ndarray): packed adjacency from pack_adjacency
+        order (list): node indices in the order to be assigned
+    Returns:
+        list: list of node indices for each clique
+    """
+    size   = packed.shape[0]
+    common = np.empty_like(packed)
+    color  = np.empty(size, dtype=np.int64)
+    count  = 0
+    for node in order:
+        hit = common[:count, node >> 3] & (0x80 >> (node & 7))
+        clique = int(np.argmax(hit)) if count else 0
+        if count and hit[clique]:
+            common[clique] &= packed[node]
+        else:
+            clique = count
+            common[clique] = packed[node]
+            count += 1
+        color[node] = clique
+    return _cliques(color)
+
+def complement_degree(packed: np.ndarray) -> np.ndarray:
+    # imported here, pauli_expression imports this package
+    from ..pauli_expression.symplectic import POPCOUNT
+    size = packed.shape[0]
+    return size - 1 - POPCOUNT[packed].astype(np.int64).sum(axis=1)
+
+def coloring_largest_first(adjacency: np.ndarray) -> list:
+    """Greedy cover in descending order of the complement degree
+
+    Args:
+        adjacency (np.ndarray): boolean (N, N) adjacency matrix
+    Returns:
+        list: list of node indices for each clique
+    """
+    packed = pack_adjacency(adjacency)
+    order  = np.argsort(-complement_degree(packed), kind="stable")
+    return greedy_cover(packed, order)
+
+def coloring_random_sequential(adjacency: np.ndarray, seed=None) -> list:
+    """Greedy cover in a random order
+
+    Args:
+        adjacency (np.ndarray): boolean (N, N) adjacency matrix
+        seed (int): seed of the random order
+    Returns:
+        list: list of node indices for each clique
+    """
+    packed = pack_adjacency(adjacency)
+    order  = np.random.default_rng(seed).permutation(packed.shape[0])
+    return greedy_cover(packed, order)
+
+def coloring_smallest_last(adjacency: np.ndarray) -> list:
+    """Greedy cover in the reverse order of removing minimum complement degree nodes
+
+    Args:
+        adjacency (np.ndarray): boolean (N, N) adjacency matrix
+    Returns:
+        list: list of node indices for each clique
+    """
+    packed    = pack_adjacency(adjacency)
+    size      = packed.shape[0]
+    degree    = complement_degree(packed)
+    remaining = np.ones(size, dtype=bool)
+    order     = np.empty(size, dtype=np.int64)
+    for position in range(size-1, -1, -1):
+        node = int(np.argmin(degree))
+        order[position]  = node
+        remaining[node]  = False
+        degree[node]     = size
+        degree -= remaining & ~_unpack(packed[node], size)
+    return greedy_cover(packed, order)
+
+def coloring_saturation_largest_first(adjacency: np.ndarray) -> list:
+    """DSATUR: assign the node that can join the fewest existing cliques first
+
+    The saturation of a node is the number of cliques it cannot join, and ties
+    are broken by the complement degree.
+
+    Args:
+        adjacency (np.ndarray): boolean (N, N) adjacency matrix
+    Returns:
+        list: list of node indices for each clique
+    """
+    packed   = pack_adjacency(adjacency)
+    size     = packed.shape[0]
+    priority = complement_degree(packed)
+    colored  = np.zeros(size, dtype=bool)
+    common   = np.empty_like(packed)
+    color    = np.empty(size, dtype=np.int64)
+    count    = 0
+    for _ in range(size):
+        node = int(np.argmax(priority))
+        hit = common[:count, node >> 3] & (0x80 >> (node & 7))
+        clique = int(np.argmax(hit)) if count else 0
+        if count and hit[clique]:
+            # nodes which could join the clique before but cannot after adding node
+            lost = common[clique] & ~packed[node]
+            common[clique] &= packed[node]
+        else:
+            clique = count
+            lost = ~packed[node]
+            common[clique] = packed[node]
+            count += 1
+        color[node]    = clique
+        colored[node]  = True
+        priority += size*(_unpack(lost, size) & ~colored)
+        priority[node] = -1
+    return _cliques(color)
@@ -1,38 +1,57 @@
 
 from collections import defaultdict
+import multiprocessing
+import time
 import numpy as np
 import networkx as nx
 import networkx.algorithms.approximation as approx
 import networkx.algorithms.coloring as coloring
 import pulp
+from . import bitset
 
-def clique_random_sequential(graph : nx.Graph) -> list:
+def graph_from_adjacency(adjacency: np.ndarray, nodes: list) -> nx.Graph:
+    """Build a networkx graph from a boolean adjacency matrix
+
+    Args:
+        adjacency (np.ndarray): boolean (N, N) symmetric matrix, the diagonal is ignored
+        nodes (list): node names for each row
+    Returns:
+        nx.Graph: graph
+    """
+    row, col = np.nonzero(np.triu(adjacency, 1))
+    graph = nx.Graph()
+    graph.add_nodes_from(nodes)
+    graph.add_edges_from(zip([nodes[i] for i in row], [nodes[j] for j in col]))
+    return graph
+
+# below this number of nodes starting a pool costs more than running the restarts
+PARALLEL_MIN_NODES = 2048
+
+def clique_random_sequential(adjacency: np.ndarray, restarts: int = 16, seed=None, processes: int = None) -> list:
     """Perform minimum clique cover with random sequential greedy method
 
-    This method will create clique greedily. At least finish with O(|V|^2).
+    Each restart visits the nodes in a random order and puts each node into the
+    first clique it can join, which is the same as growing the cliques one by one.
+    The smallest cover over all the restarts is returned. The restarts run in a
+    pool only if processes > 1, the graph has at least PARALLEL_MIN_NODES nodes and
+    the caller is not itself a daemonic worker, such as those of portfolio.
 
     Args:
-        graph (nx.Graph): graph to solve
+        adjacency (np.ndarray): boolean (N, N) adjacency matrix
+        restarts (int): number of random orders
+        seed (int): seed from which the seeds of the restarts are spawned
+        processes (int): number of worker processes, serial by default
     Returns:
-        list: list of node names for each clique
+        list: list of node indices for each clique
     """
-    graph = graph.copy()
-    clique_list = []
-    while len(graph.nodes())>0:
-        clique = []
-        node_list = list(graph.nodes())
-        np.random.permutation(node_list)
-        for node in node_list:
-            flag = True
-            for exist_node in clique:
-                if node not in graph[exist_node]:
-                    flag =False
-                    break
-            if flag:
-                clique.append(node)
-        graph.remove_nodes_from(clique)
-        clique_list.append(clique)
-    return clique_list
+    seeds = np.random.SeedSequence(seed).spawn(restarts)
+    processes = min(processes or 1, restarts)
+    if processes <= 1 or len(adjacency) < PARALLEL_MIN_NODES or multiprocessing.current_process().daemon:
+        covers = [bitset.coloring_random_sequential(adjacency, seed=child) for child in seeds]
+    else:
+        with multiprocessing.Pool(processes, initializer=_worker_init, initargs=(np.packbits(adjacency, axis=1), len(adjacency))) as pool:
+            covers = pool.starmap(_worker_run, [("coloring_random_sequential", {"seed": child}) for child in seeds])
+    return min(covers, key=len)
 
 def clique_approx_find_greedy_eliminate(graph: nx.Graph) -> list:
     """Perform minimum clique cover by approximatly find maximum clique and iteratively eliminate it.
@@ -114,88 +133,208 @@ def coloring_greedy(graph: nx.Graph, strategy: str) -> list:
 class AbortedError(Exception):
     pass
 
-def integer_programming(graph: nx.Graph) -> list:
+def _independent_set_cover(adjacency: np.ndarray) -> list:
+    """Greedily cover all the non-adjacent pairs by maximal independent sets
+
+    Args:
+        adjacency (np.ndarray): boolean (N, N) adjacency matrix
+    Returns:
+        list: sorted node indices of each independent set
+    """
+    independent = ~adjacency
+    np.fill_diagonal(independent, False)
+    uncovered = np.triu(independent, 1)
+    independent_sets = []
+    while uncovered.any():
+        n1, n2 = np.argwhere(uncovered)[0]
+        members = [n1, n2]
+        candidate = independent[n1] & independent[n2]
+        while candidate.any():
+            # prefer the node sharing the most uncovered pairs with the members
+            gain = (uncovered[members] | uncovered[:, members].T).sum(axis=0)
+            node = int(np.argmax(np.where(candidate, gain + 1, 0)))
+            members.append(node)
+            candidate &= independent[node]
+        members = sorted(members)
+        uncovered[np.ix_(members, members)] = False
+        independent_sets.append(members)
+    return independent_sets
+
+def integer_programming(graph: nx.Graph, time_limit: float = 5, gap: float = None) -> list:
     """Perform minimum clique cover by reducing problem into integer programming.
 
+    The number of clique slots is bounded by the DSATUR greedy cover, which is
+    also given to the solver as the initial solution. The nodes of the largest
+    independent set found are fixed to distinct slots, the other i-th node may
+    only join the first i+1 slots, and slots are used in order, which removes
+    most of the symmetric solutions. Non-adjacent pairs are excluded with one
+    constraint per independent set and slot.
+
     If solver says optimal, optimal solution for minimum clique cover is obtained,
-    but it may take very long time for large problems.
+    otherwise the best cover found within the time limit is returned.
 
     TODO: Check installation of commercial IP solvers such as CPLEX, Gurobi, and 
     use them if they are installed.
 
     Args:
         graph (nx.Graph): graph to solve
+        time_limit (float): time limit of the solver in seconds
+        gap (float): relative optimality gap to stop at
     Returns:
         list: list of node names for each clique
-    Raises:
-        Exception: Solver cannot solve IP problem.
     """
+    nodes     = list(graph.nodes())
+    adjacency = nx.to_numpy_array(graph, nodelist=nodes, dtype=bool, weight=None)
+    greedy    = bitset.coloring_saturation_largest_first(adjacency)
+    independent_sets = _independent_set_cover(adjacency)
+    fixed     = max(independent_sets, key=len) if independent_sets else greedy[0][:1]
+    clique_max_count = len(greedy)
+    # every clique contains at most one node of an independent set
+    if clique_max_count <= len(fixed):
+        return [[nodes[i] for i in clique] for clique in greedy]
+
+    # slots allowed for each node, the fixed nodes come first in the order
+    order    = fixed + [node for node in range(len(nodes)) if node not in set(fixed)]
+    position = np.empty(len(nodes), dtype=int)
+    position[order] = np.arange(len(nodes))
+    slots    = [[position[node]] if position[node] < len(fixed) else range(min(position[node]+1, clique_max_count)) for node in range(len(nodes))]
+
     problem = pulp.LpProblem("clique_cover", pulp.LpMinimize)
+    clique_vars = [pulp.LpVariable("clique{}".format(ind), lowBound=int(ind < len(fixed)), cat="Binary") for ind in range(clique_max_count)]
+    node_belong_vars = [{ind: pulp.LpVariable("node{}_{}".format(node, ind), cat="Binary") for ind in slots[node]} for node in range(len(nodes))]
 
-    clique_max_count = len(graph.nodes())
-    clique_vars = []
-    for ind in range(clique_max_count):
-        var = pulp.LpVariable("clique{}".format(ind), cat="Binary")
-        clique_vars.append(var)
-
-    node_belong_vars = []
-    for ind in range(clique_max_count):
-        node_belong_vars.append({})
-        for node in graph.nodes():
-            nodename = str(node)
-            nodename = nodename.replace("  ","0").replace(" i","1").replace(" -","2").replace("-i","3")
-            var = pulp.LpVariable("{}_{}".format(nodename,ind), cat = "Binary")
-            node_belong_vars[ind][node] = var
-    
     # minimize used cliques
-    problem += sum(clique_vars)
+    problem += pulp.lpSum(clique_vars)
 
-    # if node belongs, clique must be used
-    for ind in range(clique_max_count):
-        for node in graph.nodes():
-            problem += (node_belong_vars[ind][node] <= clique_vars[ind])
+    # use cliques in order
+    for ind in range(len(fixed), clique_max_count-1):
+        problem += (clique_vars[ind] >= clique_vars[ind+1])
+
+    # clique must be exclusive
+    for belong_vars in node_belong_vars:
+        problem += (pulp.lpSum(belong_vars.values()) == 1)
 
-    # clique must be exclusive   
-    for node in graph.nodes():
-        items = []
+    # not-neighboring nodes cannot belong the same clique, imposed once per independent set
+    covered = np.zeros(len(nodes), dtype=bool)
+    for independent_set in independent_sets:
+        covered[independent_set] = True
         for ind in range(clique_max_count):
-            items.append(node_belong_vars[ind][node])
-        problem += (sum(items)==1)
-
-    # not-neighboring nodes cannot belong the same clique
-    for ind in range(clique_max_count):
-        for i1, n1 in enumerate(graph.nodes()):
-            for i2, n2 in enumerate(graph.nodes()):
-                if i2<=i1: continue
-                if n2 not in graph[n1]:
-                    problem += (node_belong_vars[ind][n1]+node_belong_vars[ind][n2]<=1)
-    
-    #status = problem.solve()
-    import multiprocessing
-    cpu_count = multiprocessing.cpu_count()
-    status = problem.solve(pulp.PULP_CBC_CMD(threads=cpu_count, keepFiles=0, mip=1, maxSeconds=5))
-    #status = problem.solve(pulp.PULP_CBC_CMD(maxSeconds=5, msg=0, fracGap=0))
-    #print(problem)
-    #print(pulp.LpStatus[status])
-    #print(problem.objective.value())
+            items = [node_belong_vars[node][ind] for node in independent_set if ind in node_belong_vars[node]]
+            if items:
+                problem += (pulp.lpSum(items) <= clique_vars[ind])
 
-    # cannot solve
-    if status <= 0:
-        raise AbortedError("Solver cannot solve problem.")
+    # if node belongs, clique must be used
+    for node in np.flatnonzero(~covered):
+        for ind, var in node_belong_vars[node].items():
+            problem += (var <= clique_vars[ind])
+
+    # greedy cover as the initial solution: the clique with the i-th fixed node
+    # goes to slot i, and the others to the next slots sorted by their first node
+    clique_slot = {}
+    for ind, node in enumerate(fixed):
+        clique_slot.update({member: ind for member in next(clique for clique in greedy if node in clique)})
+    rest = sorted((clique for clique in greedy if clique[0] not in clique_slot), key=lambda clique: min(position[clique]))
+    for ind, clique in enumerate(rest):
+        clique_slot.update({member: len(fixed)+ind for member in clique})
+    for ind, var in enumerate(clique_vars):
+        var.setInitialValue(1)
+    for node, belong_vars in enumerate(node_belong_vars):
+        for ind, var in belong_vars.items():
+            var.setInitialValue(int(ind == clique_slot[node]))
+
+    cpu_count = multiprocessing.cpu_count()
+    try:
+        problem.solve(pulp.PULP_CBC_CMD(threads=cpu_count, msg=False, timeLimit=time_limit, gapRel=gap, warmStart=True))
+    except pulp.PulpSolverError:
+        return [[nodes[i] for i in clique] for clique in greedy]
 
     clique_dict = defaultdict(list)
-    node_count = 0
-    for node in graph.nodes():
-        for index in range(clique_max_count):
-            var = node_belong_vars[index][node]
-            if(var.value()>=0.5):
-                clique_dict[index].append(node)
-                node_count += 1
-                break
+    for node, belong_vars in enumerate(node_belong_vars):
+        values = {ind: var.value() for ind, var in belong_vars.items()}
+        if None in values.values() or max(values.values()) < 0.5:
+            # no incumbent from the solver
+            return [[nodes[i] for i in clique] for clique in greedy]
+        clique_dict[max(values, key=values.get)].append(nodes[node])
     return list(clique_dict.values())
 
+class CliqueCover(list):
+    """List of cliques with the strategy which produced it
+
+    Attributes:
+        strategy (str): name of the strategy
+        sizes (dict): number of cliques found by each strategy tried
+    """
+    def __init__(self, cliques, strategy, sizes=None):
+        super().__init__(cliques)
+        self.strategy = strategy
+        self.sizes    = sizes if sizes is not None else {strategy: len(cliques)}
+
+_worker_adjacency = None
+
+def _worker_init(packed, size):
+    global _worker_adjacency
+    _worker_adjacency = np.unpackbits(packed, axis=1, count=size).astype(bool)
+
+def _worker_run(strategy, options):
+    return clique_cover(_worker_adjacency, strategy, **options)
+
+default_portfolio = [
+    "coloring_largest_first",
+    "coloring_smallest_last",
+    "coloring_saturation_largest_first",
+    "coloring_independent_set",
+    "clique_approx_find_greedy_eliminate",
+]
+
+def portfolio(adjacency: np.ndarray, strategies: list = None, restarts: int = 16, time_limit: float = 10, processes: int = None) -> list:
+    """Run several strategies in a process pool and keep the smallest cover
+
+    Strategies still running when time_limit expires are terminated, and the
+    exception of a failing strategy is recorded in sizes instead of its size. The
+    largest-first greedy cover is computed beforehand, so a cover is always returned.
+
+    Args:
+        adjacency (np.ndarray): boolean (N, N) adjacency matrix
+        strategies (list): names of strategies, defaults to default_portfolio
+        restarts (int): number of coloring_random_sequential runs with different seeds
+        time_limit (float): wall-clock budget in seconds
+        processes (int): number of worker processes, defaults to the number of CPUs
+    Returns:
+        CliqueCover: list of node indices for each clique, with the winning strategy
+    """
+    start  = time.time()
+    best   = CliqueCover(bitset.coloring_largest_first(adjacency), "coloring_largest_first")
+    sizes  = dict(best.sizes)
+    names  = strategies if strategies is not None else default_portfolio
+    # fast bitset strategies and restarts are queued before the networkx ones
+    tasks  = [(name, {}) for name in names if name in bitset_strategy_func]
+    tasks += [("coloring_random_sequential", {"seed": seed}) for seed in range(restarts)]
+    tasks += [(name, {}) for name in names if name not in bitset_strategy_func]
+
+    pool = multiprocessing.Pool(processes, initializer=_worker_init, initargs=(np.packbits(adjacency, axis=1), len(adjacency)))
+    try:
+        results = [(name, options, pool.apply_async(_worker_run, (name, options))) for name, options in tasks]
+        for name, options, result in results:
+            remaining = time_limit - (time.time() - start)
+            label = name if not options else "{}(seed={})".format(name, options["seed"])
+            try:
+                cover = result.get(timeout=max(remaining, 0))
+            except (multiprocessing.TimeoutError, AbortedError):
+                continue
+            except Exception as error:
+                # a failing strategy does not lose the covers already found
+                sizes[label] = "{}: {}".format(type(error).__name__, error)
+                continue
+            sizes[label] = len(cover)
+            if len(cover) < len(best):
+                best = CliqueCover(cover, label)
+    finally:
+        pool.terminate()
+    best.sizes = sizes
+    return best
+
 strategy_func = {
-    "clique_random_sequential" : clique_random_sequential,
+    "clique_random_sequential" : None,
     "clique_approx_find_greedy_eliminate" : clique_approx_find_greedy_eliminate,
     "clique_exact_find_greedy_eliminate" : clique_exact_find_greedy_eliminate,
     "clique_exact_find_once_greedy_eliminate" : clique_exact_find_once_greedy_eliminate,
@@ -207,24 +346,49 @@ strategy_func = {
     "coloring_connected_sequential_dfs" : None,
     "coloring_saturation_largest_first" : None,
     "integer_programming" : integer_programming,
+    "portfolio" : None,
+}
+
+bitset_strategy_func = {
+    "clique_random_sequential" : clique_random_sequential,
+    "coloring_largest_first" : bitset.coloring_largest_first,
+    "coloring_smallest_last" : bitset.coloring_smallest_last,
+    "coloring_saturation_largest_first" : bitset.coloring_saturation_largest_first,
+    "coloring_random_sequential" : bitset.coloring_random_sequential,
+    "portfolio" : portfolio,
 }
 
 clique_cover_strategies = strategy_func.keys()
 
-def clique_cover(graph: nx.graph, strategy:str ="clique_random_sequential") -> list:
+def clique_cover(graph, strategy:str ="clique_random_sequential", **options) -> list:
     """Perform minimum clique cover using several strategies
 
+    The strategies in bitset_strategy_func work on a packed adjacency matrix
+    and the others on a networkx graph; the input is converted when needed.
+
     Args:
-        graph (nx.Graph): graph to solve
+        graph (nx.Graph or np.ndarray): graph to solve, or its boolean adjacency matrix
         strategy (str): name of strategy
+        options: keyword arguments of the strategy, e.g. time_limit of "portfolio"
     Returns:
-        list: list of node names for each clique
+        list: list of node names for each clique, node indices for an adjacency matrix
     """
     if strategy not in strategy_func:
         raise ValueError("Unknown strategy, choose from {}".format(strategy_func.keys()))
 
+    if strategy in bitset_strategy_func:
+        if isinstance(graph, nx.Graph):
+            nodes = list(graph.nodes())
+            adjacency = nx.to_numpy_array(graph, nodelist=nodes, dtype=bool, weight=None)
+            cover = bitset_strategy_func[strategy](adjacency, **options)
+            cliques = [[nodes[i] for i in clique] for clique in cover]
+            return CliqueCover(cliques, cover.strategy, cover.sizes) if isinstance(cover, CliqueCover) else cliques
+        return bitset_strategy_func[strategy](graph, **options)
+    if not isinstance(graph, nx.Graph):
+        graph = graph_from_adjacency(graph, list(range(len(graph))))
+
     coloring_prefix = "coloring_"
     if coloring_prefix in strategy:
         return coloring_greedy(graph, strategy = strategy[len(coloring_prefix):])
-    return strategy_func[strategy](graph)
+    return strategy_func[strategy](graph, **options)
 
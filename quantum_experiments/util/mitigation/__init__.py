@@ -0,0 +1,2 @@
+from .extrapolation import extrapolate, extrapolation_models, extrapolation_weights
+from .readout import ReadoutMitigation
\ No newline at end of file
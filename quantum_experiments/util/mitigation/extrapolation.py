@@ -0,0 +1,60 @@
+import numpy as np
+
+extrapolation_models = ["linear", "richardson", "exponential"]
+
+def _intercept(stretch, values, degree):
+    """Value at zero stretch of least-squares polynomials fitted to every column at once"""
+    vandermonde = np.vander(stretch, degree+1, increasing=True)
+    coeff, *_ = np.linalg.lstsq(vandermonde, values, rcond=None)
+    return coeff[0]
+
+def extrapolate(stretch, values, model="linear", order=None, clip=True):
+    """Zero-noise extrapolation of many expectation values with one least-squares solve
+
+    Args:
+        stretch (list): noise stretch factor of each row of values
+        values (np.ndarray): (len(stretch), number of observables) expectation values
+        model (str): "linear" fits a line, "richardson" a polynomial of degree order
+            (len(stretch)-1 by default), "exponential" fits a*exp(b*stretch) to the
+            absolute values, falling back to linear for observables that change sign
+        order (int): polynomial degree of "richardson"
+        clip (bool): clip the results to [-1, 1]
+    Returns:
+        np.ndarray: extrapolated value of each observable
+    """
+    stretch = np.asarray(stretch, dtype=float)
+    values  = np.asarray(values, dtype=float)
+    if model == "linear":
+        result = _intercept(stretch, values, 1)
+    elif model == "richardson":
+        result = _intercept(stretch, values, len(stretch)-1 if order is None else order)
+    elif model == "exponential":
+        result = _intercept(stretch, values, 1)
+        sign   = np.sign(values[0])
+        usable = np.all(values*sign > 0, axis=0)
+        if usable.any():
+            result[usable] = sign[usable]*np.exp(_intercept(stretch, np.log(np.abs(values[:, usable])), 1))
+    else:
+        raise ValueError("Unknown model, choose from {}".format(extrapolation_models))
+    if clip:
+        result = np.clip(result, -1, 1)
+    return result
+
+def extrapolation_weights(stretch, model="linear", order=None):
+    """Weights w such that the extrapolated value is sum_k w[k] values[k]
+
+    Used to propagate the statistical errors of the stretched values. The
+    intercept of "linear" and "richardson" is linear in the values, and the
+    weights of the linear fit are used for "exponential".
+
+    Args:
+        stretch (list): noise stretch factors
+        model (str): model of extrapolate
+        order (int): polynomial degree of "richardson"
+    Returns:
+        np.ndarray: weight of each stretch factor
+    """
+    stretch = np.asarray(stretch, dtype=float)
+    if len(stretch) == 1:
+        return np.ones(1)
+    return extrapolate(stretch, np.eye(len(stretch)), model="richardson" if model == "richardson" else "linear", order=order, clip=False)
@@ -0,0 +1,65 @@
+import numpy as np
+from ..histogram import Histogram
+
+class ReadoutMitigation:
+    def __init__(self, assignment, blocks):
+        """Tensored readout-error mitigation
+
+        The readout error is modeled as a tensor product of assignment matrices
+        A[measured, prepared] acting on disjoint blocks of qubits, so its inverse is
+        applied block by block on the histogram reshaped into a (2, ..., 2) tensor,
+        in O(2^k n 2^n) for blocks of k qubits, without building a 2^n x 2^n matrix.
+        Mitigated values may be slightly negative, which keeps Pauli expectations unbiased.
+
+        Args:
+            assignment (list): 2^k x 2^k assignment matrix of each block
+            blocks (list): tuple of qubit positions in the histogram bitstring of each block
+        """
+        self.assignment = [np.asarray(matrix, dtype=float) for matrix in assignment]
+        self.blocks     = [tuple(block) for block in blocks]
+        self.inverse    = [np.linalg.inv(matrix) for matrix in self.assignment]
+        self.n          = sum(len(block) for block in self.blocks)
+
+    @classmethod
+    def from_histograms(cls, histograms, blocks=None):
+        """Calibrate the assignment matrices from histograms of prepared basis states
+
+        Each block matrix averages the block marginals of every histogram, using the
+        prepared bits of the block as the column.
+
+        Args:
+            histograms (dict): {prepared bitstring: histogram}
+            blocks (list): tuples of qubit positions, defaults to one block per qubit
+        Returns:
+            ReadoutMitigation: calibrated mitigation
+        """
+        n = len(next(iter(histograms)))
+        blocks = [(qubit,) for qubit in range(n)] if blocks is None else [tuple(block) for block in blocks]
+        counts = [np.zeros((2**len(block), 2**len(block))) for block in blocks]
+        for prepared, histogram in histograms.items():
+            tensor = Histogram.from_dict(histogram).to_dense().count.reshape((2,)*n)
+            for block, count in zip(blocks, counts):
+                column   = int("".join(prepared[qubit] for qubit in block), 2)
+                marginal = tensor.sum(axis=tuple(q for q in range(n) if q not in block))
+                # the remaining axes are in increasing qubit order
+                marginal = np.transpose(marginal, np.argsort(np.argsort(block))).reshape(-1)
+                count[:, column] += marginal
+        assignment = [count/count.sum(axis=0, keepdims=True) for count in counts]
+        return cls(assignment, blocks)
+
+    def apply(self, histogram):
+        """Mitigated histogram
+
+        Args:
+            histogram (Histogram or dict): measured histogram
+        Returns:
+            Histogram: dense mitigated histogram
+        """
+        histogram = Histogram.from_dict(histogram)
+        tensor = histogram.to_dense().count.reshape((2,)*histogram.n)
+        for block, inverse in zip(self.blocks, self.inverse):
+            tensor = np.moveaxis(tensor, block, range(len(block)))
+            shape  = tensor.shape
+            tensor = (inverse@tensor.reshape(2**len(block), -1)).reshape(shape)
+            tensor = np.moveaxis(tensor, range(len(block)), block)
+        return Histogram(histogram.n, dense=tensor.reshape(-1))
@@ -1,2 +1,3 @@
 from .pauli_observable import PauliObservable
-from .pauli_transfer_matrix import PauliTransferMatrix, StabilizerPauliTransferMatrix
\ No newline at end of file
+from .pauli_transfer_matrix import PauliTransferMatrix, StabilizerPauliTransferMatrix
+from .clifford import CliffordTableau
\ No newline at end of file
@@ -0,0 +1,215 @@
+import numpy as np
+from .common import pauli_labels
+from .sparse_pauli import SparsePauli, pauli_decompose
+from .symplectic import unpack_labels, to_labels
+
+ROUND_ERROR = 1e-8
+
+class CliffordTableau:
+    def __init__(self, x, z, sign):
+        """Clifford operator U given by the images U P U^dagger of the generators
+
+        Rows 0..n-1 are the images of X_0..X_{n-1} and rows n..2n-1 the images of
+        Z_0..Z_{n-1}, each given as sign*P(x, z) with a Hermitian Pauli P.
+
+        Args:
+            x (np.ndarray): boolean (2n, n) array of x bits of the images
+            z (np.ndarray): boolean (2n, n) array of z bits of the images
+            sign (np.ndarray): (2n,) array, True where the image has sign -1
+        """
+        self.x    = np.asarray(x, dtype=bool)
+        self.z    = np.asarray(z, dtype=bool)
+        self.sign = np.asarray(sign, dtype=bool)
+        self.n    = self.x.shape[1]
+
+    @classmethod
+    def from_images(cls, x_images, z_images):
+        """Create from signed labels, e.g. CNOT = from_images(["XX","IX"], ["ZI","ZZ"])
+
+        Args:
+            x_images (list): images of X_0..X_{n-1} such as "+XX" or "-ZI"
+            z_images (list): images of Z_0..Z_{n-1}
+        Returns:
+            CliffordTableau: tableau
+        """
+        images = list(x_images) + list(z_images)
+        sign   = [image.startswith("-") for image in images]
+        x, z   = unpack_labels([image.lstrip("+-") for image in images])
+        return cls(x, z, sign)
+
+    @classmethod
+    def from_unitary(cls, unitary):
+        """Recognize a Clifford unitary
+
+        Args:
+            unitary (np.ndarray): 2^n x 2^n unitary
+        Returns:
+            CliffordTableau: tableau, or None if the unitary is not a Clifford
+        """
+        n      = int(np.log2(unitary.shape[0]))
+        images = []
+        for generator in ("X", "Z"):
+            for qubit in range(n):
+                label = "I"*qubit + generator + "I"*(n-qubit-1)
+                image = unitary@(SparsePauli(label)@unitary.T.conj())
+                coeff = pauli_decompose(image)/2**n
+                index = np.argmax(np.abs(coeff))
+                if abs(abs(coeff[index].real)-1) > ROUND_ERROR:
+                    return None
+                images.append(("-" if coeff[index].real < 0 else "+") + pauli_labels(n)[index])
+        return cls.from_images(images[:n], images[n:])
+
+    def conjugate(self, x, z):
+        """Images U P U^dagger of Hermitian Paulis P(x, z)
+
+        Args:
+            x (np.ndarray): boolean (N, n) array
+            z (np.ndarray): boolean (N, n) array
+        Returns:
+            tuple: boolean (N, n) arrays x, z and (N,) array of signs +1/-1
+        """
+        # operator as i^phase X^x Z^z, starting from P(x, z) = i^(x.z) X^x Z^z
+        phase   = np.sum(x & z, axis=1)
+        image_x = np.zeros_like(x)
+        image_z = np.zeros_like(z)
+        generator_phase = 2*self.sign + np.sum(self.x & self.z, axis=1)
+        for row, selected in enumerate(np.concatenate([x, z], axis=1).T):
+            if not selected.any():
+                continue
+            # X^a Z^b X^c Z^d = (-1)^(b.c) X^(a^c) Z^(b^d)
+            phase[selected] += generator_phase[row] + 2*np.sum(image_z[selected] & self.x[row], axis=1)
+            image_x[selected] ^= self.x[row]
+            image_z[selected] ^= self.z[row]
+        phase -= np.sum(image_x & image_z, axis=1)
+        return image_x, image_z, 1 - (phase % 4)
+
+    def ptm_entries(self, prep_mask=None, meas_mask=None):
+        """Nonzero entries of the Pauli transfer matrix in O(4^n n^2)
+
+        Args:
+            prep_mask (np.ndarray): boolean mask over pauli_labels(n) of allowed prep Paulis
+            meas_mask (np.ndarray): boolean mask over pauli_labels(n) of allowed meas Paulis
+        Returns:
+            tuple: prep indices, meas indices and values (+1/-1) in pauli_labels order
+        """
+        power      = 4**np.arange(self.n-1, -1, -1, dtype=np.int64)
+        prep_index = np.arange(4**self.n, dtype=np.int64)
+        if prep_mask is not None:
+            prep_index = prep_index[prep_mask]
+        digit = prep_index[:, None]//power % 4
+        image_x, image_z, value = self.conjugate((digit == 1) | (digit == 2), (digit == 2) | (digit == 3))
+        meas_digit = np.array([0, 3, 1, 2], dtype=np.int64)[2*image_x + image_z]
+        meas_index = meas_digit@power
+        if meas_mask is not None:
+            keep       = meas_mask[meas_index]
+            prep_index = prep_index[keep]
+            meas_index = meas_index[keep]
+            value      = value[keep]
+        return prep_index, meas_index, value
+
+def _row_reduce(matrix, columns):
+    """Reduce rows of a boolean matrix in place on the given columns over GF(2)
+
+    Returns:
+        list: pivot column of each leading row
+    """
+    pivots = []
+    for column in columns:
+        rank = len(pivots)
+        candidates = np.flatnonzero(matrix[rank:, column])
+        if candidates.size == 0:
+            continue
+        matrix[[rank, rank+candidates[0]]] = matrix[[rank+candidates[0], rank]]
+        others = np.flatnonzero(matrix[:, column])
+        others = others[others != rank]
+        matrix[others] ^= matrix[rank]
+        pivots.append(column)
+        if len(pivots) == matrix.shape[0]:
+            break
+    return pivots
+
+def apply_clifford(x, z, sign, gates):
+    """Conjugate Hermitian Paulis by a circuit of H, S, CNOT and CZ gates
+
+    Args:
+        x (np.ndarray): boolean (N, n) array, updated in place
+        z (np.ndarray): boolean (N, n) array, updated in place
+        sign (np.ndarray): boolean (N,) array, True for sign -1, updated in place
+        gates (list): gates such as ("H", q), ("S", q), ("CNOT", control, target), ("CZ", q0, q1)
+    """
+    for gate in gates:
+        if gate[0] == "H":
+            a = gate[1]
+            sign ^= x[:, a] & z[:, a]
+            x[:, a], z[:, a] = z[:, a].copy(), x[:, a].copy()
+        elif gate[0] == "S":
+            a = gate[1]
+            sign ^= x[:, a] & z[:, a]
+            z[:, a] ^= x[:, a]
+        elif gate[0] == "CNOT":
+            c, t = gate[1], gate[2]
+            sign ^= x[:, c] & z[:, t] & ~(x[:, t] ^ z[:, c])
+            x[:, t] ^= x[:, c]
+            z[:, c] ^= z[:, t]
+        elif gate[0] == "CZ":
+            apply_clifford(x, z, sign, [("H", gate[2]), ("CNOT", gate[1], gate[2]), ("H", gate[2])])
+        else:
+            raise ValueError("Unknown gate {}".format(gate[0]))
+
+def diagonalize(labels):
+    """Synthesize a Clifford circuit mapping commuting Paulis to Z-type Paulis
+
+    The circuit consists of H on some qubits, CNOTs, CZs and S gates, and
+    finally H on the pivot qubits. Measuring in the Z basis after the circuit
+    gives <P> = sign * <Z-type label> for every input Pauli P.
+
+    Args:
+        labels (list): mutually commuting Pauli labels
+    Returns:
+        tuple: list of gates, list of Z-type labels, list of signs (+1/-1)
+    """
+    x, z   = unpack_labels(labels)
+    n      = x.shape[1]
+    gates  = []
+
+    # independent generators with their X block in reduced row echelon form
+    tableau = np.concatenate([x, z], axis=1)
+    pivots  = _row_reduce(tableau, range(2*n))
+    tableau = tableau[:len(pivots)]
+    x_pivots = _row_reduce(tableau, range(n))
+
+    # Hadamards make the X block full rank, pivots of Z-only rows avoid X pivots
+    rest = [q for q in range(n) if q not in x_pivots]
+    for q in _row_reduce(tableau[len(x_pivots):, n:], rest):
+        gates.append(("H", q))
+    gen_x, gen_z = tableau[:, :n].copy(), tableau[:, n:].copy()
+    apply_clifford(gen_x, gen_z, np.zeros(len(gen_x), dtype=bool), gates)
+
+    # CNOTs clear the X block outside of the pivot columns
+    tableau = np.concatenate([gen_x, gen_z], axis=1)
+    x_pivots = _row_reduce(tableau, range(n))
+    gen_x, gen_z = tableau[:, :n], tableau[:, n:]
+    cnots = []
+    for row, control in enumerate(x_pivots):
+        for target in np.flatnonzero(gen_x[row]):
+            if target != control:
+                cnots.append(("CNOT", control, int(target)))
+    apply_clifford(gen_x, gen_z, np.zeros(len(gen_x), dtype=bool), cnots)
+    gates += cnots
+
+    # CZs and Ss clear the (symmetric) Z block on the pivot columns, then H makes rows Z-type
+    phases = []
+    for i, a in enumerate(x_pivots):
+        if gen_z[i, a]:
+            phases.append(("S", a))
+        for b in x_pivots[i+1:]:
+            if gen_z[i, b]:
+                phases.append(("CZ", a, b))
+    gates += phases
+    gates += [("H", a) for a in x_pivots]
+
+    sign = np.zeros(len(labels), dtype=bool)
+    apply_clifford(x, z, sign, gates)
+    if x.any():
+        raise ValueError("Paulis do not commute")
+    return gates, to_labels(x, z), list(1 - 2*sign.astype(int))
@@ -1,4 +1,6 @@
 import math
+import itertools
+import functools
 import numpy as np
 
 dtype = np.complex128
@@ -14,6 +16,30 @@ def tensor(gate_list):
         out = np.kron(out,gate)
     return out
 
+@functools.lru_cache(maxsize=None)
+def pauli_labels(n):
+    """Pauli labels of n qubits in the order of itertools.product, shared per n"""
+    return tuple(''.join(i) for i in itertools.product(['I','X','Y','Z'],repeat=n))
+
+@functools.lru_cache(maxsize=None)
+def pauli_matrices(n):
+    """Dense Pauli basis of n qubits, built on first use and shared per n"""
+    return tuple(tensor(list(i)) for i in itertools.product([I,X,Y,Z],repeat=n))
+
+@functools.lru_cache(maxsize=None)
+def pauli_index_map(n):
+    """Map from Pauli label of n qubits to its position in pauli_labels(n)"""
+    return {label: index for index, label in enumerate(pauli_labels(n))}
+
+def pauli_index(labels):
+    """Positions of Pauli labels in pauli_labels(n), computed without the label table"""
+    labels = list(labels)
+    n = len(labels[0])
+    chars = np.frombuffer("".join(labels).encode(), dtype=np.uint8).reshape(len(labels), n)
+    digit = np.zeros(256, dtype=np.int64)
+    digit[[ord("X"), ord("Y"), ord("Z")]] = [1, 2, 3]
+    return digit[chars]@(4**np.arange(n-1, -1, -1, dtype=np.int64))
+
 def check_simul(pauli0, pauli1):
     flag = True
     for i,j in zip(pauli0, pauli1):
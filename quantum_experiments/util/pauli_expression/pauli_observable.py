@@ -1,18 +1,26 @@
 import numpy as np
-import itertools
-import networkx as nx
-from .common import I,X,Y,Z,tensor,check_simul,get_most_complex_pauli_label
-from ..minimum_clique_cover import clique_cover
+import scipy.sparse as sp
+from .common import pauli_labels,pauli_matrices,get_most_complex_pauli_label
+from .sparse_pauli import SparsePauli, pauli_decompose
+from .symplectic import pack_labels, unpack_labels, simul_matrix, commute_matrix
+from .clifford import diagonalize
+from ..minimum_clique_cover import clique_cover, graph_from_adjacency
 
 ROUND_ERROR = 1e-10
 
 class PauliObservable:
-    def __init__(self,observable=None,obs_dict=None):
-        if (observable is not None) and (obs_dict is not None):
-            raise("input must be only [observable] or [obs_dict]")
+    def __init__(self,observable=None,obs_dict=None,terms=None):
+        """Observable expanded in the Pauli basis
 
-        if (observable is None) and (obs_dict is None):
-            raise("input must not be None")
+        Args:
+            observable (np.ndarray): dense 2^n x 2^n Hermitian matrix, decomposed by calculate
+            obs_dict (dict): {label: coefficient}
+            terms (list): [(label, coefficient), ...] or {label: coefficient}, repeated labels are summed
+        """
+        if [observable is not None, obs_dict is not None, terms is not None].count(True) != 1:
+            raise ValueError("input must be only one of [observable], [obs_dict] or [terms]")
+
+        self.observable = None
 
         if observable is not None:
             self.observable     = observable
@@ -20,32 +28,187 @@ class PauliObservable:
             self.obs            = None
 
         if obs_dict is not None:
-            self.n = len(list(obs_dict.keys())[0][0])
+            self.n = len(list(obs_dict.keys())[0])
             self.obs = obs_dict
 
-        self.pauli = [tensor(list(i)) for i in itertools.product([I,X,Y,Z],repeat=self.n)]
-        self.label = [''.join(i) for i in itertools.product(['I','X','Y','Z'],repeat=self.n)]
+        if terms is not None:
+            if isinstance(terms, dict):
+                terms = terms.items()
+            self.obs = {}
+            for label, coeff in terms:
+                self.obs[label] = self.obs.get(label, 0) + np.real(coeff)
+            self.obs = {label: coeff for label, coeff in self.obs.items() if abs(coeff) > ROUND_ERROR}
+            self.n   = len(next(iter(self.obs)))
+
+    @property
+    def label(self):
+        return pauli_labels(self.n)
+
+    @property
+    def pauli(self):
+        return pauli_matrices(self.n)
 
     def calculate(self):
+        if self.observable is None:
+            return
         self.obs = {}
-        for label, pauli in zip(self.label,self.pauli):
-            value = np.trace(pauli@self.observable).real/2**self.n
-            if abs(value) > ROUND_ERROR:
-                self.obs[label] = value
+        values = pauli_decompose(self.observable).real/2**self.n
+        for index in np.flatnonzero(np.abs(values) > ROUND_ERROR):
+            self.obs[self.label[index]] = values[index]
+
+    def to_sparse_matrix(self):
+        """Sum of the Pauli terms as a scipy.sparse matrix, built in O(terms * 2^n)"""
+        rows, cols, data = [], [], []
+        for label, coeff in self.obs.items():
+            pauli = SparsePauli(label)
+            rows.append(pauli.perm)
+            cols.append(np.arange(2**self.n))
+            data.append(coeff*pauli.phase)
+        matrix = sp.coo_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=(2**self.n, 2**self.n))
+        return matrix.tocsr()
 
-    def get_graph(self):
+    def get_graph(self, grouping="qubit_wise"):
+        """Compatibility graph of the Pauli terms
+
+        Args:
+            grouping (str): "qubit_wise" for qubit-wise compatibility, or "commute" for
+                general commutation, measured through a diagonalization circuit
+        """
+        if grouping not in ("qubit_wise", "commute"):
+            raise ValueError("Unknown grouping, choose from qubit_wise or commute")
         nodes = list(self.obs.keys())
-        edges = []
-        for pauli0, pauli1 in itertools.combinations(nodes,2):
-            if check_simul(pauli0,pauli1):
-                edges.append((pauli0, pauli1))
-        self.graph = nx.Graph()
-        self.graph.add_nodes_from(nodes)
-        self.graph.add_edges_from(edges)
-
-    def get_clique_dict(self, strategy):
-        nodes_list  = clique_cover(self.graph,strategy)
-        self.clique_dict = {}
+        x, z = pack_labels(nodes)
+        if grouping == "qubit_wise":
+            self.adjacency = simul_matrix(x, z)
+        else:
+            self.adjacency = commute_matrix(x, z)
+        self.grouping = grouping
+        np.fill_diagonal(self.adjacency, False)
+        self.nodes  = nodes
+        self._graph = None
+
+    @property
+    def graph(self):
+        """networkx graph of get_graph, built on first use"""
+        if self._graph is None:
+            self._graph = graph_from_adjacency(self.adjacency, self.nodes)
+        return self._graph
+
+    def get_clique_dict(self, strategy, **options):
+        """Group the Pauli terms into measurement settings
+
+        For "commute" grouping, clique_circuit[clique_key] holds the Clifford circuit
+        to insert before a Z-basis measurement, and measured_pauli[label] the
+        (Z-type label, sign) to be passed to expect_pauli for each term.
+        """
+        cover       = clique_cover(self.adjacency,strategy,**options)
+        nodes_list  = [[self.nodes[i] for i in clique] for clique in cover]
+        self.clique_strategy = getattr(cover, "strategy", strategy)
+        self.clique_dict    = {}
+        self.clique_circuit = {}
+        self.measured_pauli = {}
         for nodes in nodes_list:
+            self._add_clique(nodes)
+
+    def _add_clique(self, nodes):
+        if self.grouping == "qubit_wise":
             clique_key = get_most_complex_pauli_label(nodes)
-            self.clique_dict[clique_key] = nodes
\ No newline at end of file
+            # cliques sharing a measurement basis are measured together
+            nodes = self.clique_dict.get(clique_key, []) + nodes
+        else:
+            clique_key = nodes[0]
+            gates, z_labels, signs = diagonalize(nodes)
+            self.clique_circuit[clique_key] = gates
+            for label, z_label, sign in zip(nodes, z_labels, signs):
+                self.measured_pauli[label] = (z_label, sign)
+        self.clique_dict[clique_key] = nodes
+
+    def _remove_clique(self, clique_key):
+        nodes = self.clique_dict.pop(clique_key)
+        self.clique_circuit.pop(clique_key, None)
+        for label in nodes:
+            self.measured_pauli.pop(label, None)
+        return nodes
+
+    def update_terms(self, added=None, removed=None):
+        """Add and remove Pauli terms and repair clique_dict locally
+
+        Removed terms leave their cliques, and each new term joins the first clique
+        it is compatible with (with the clique key for "qubit_wise", with every member
+        for "commute"), or starts a new clique. Only the changed cliques get a new key
+        and diagonalization circuit, so the cost scales with the size of the change
+        rather than with the whole cover. The graph of get_graph is discarded, so
+        get_graph has to be called again before grouping from scratch, and
+        the dense observable is dropped in favor of the updated terms.
+
+        Args:
+            added (list): [(label, coefficient), ...] or {label: coefficient}, added to existing coefficients
+            removed (list): labels to remove
+        """
+        added = list(added.items() if isinstance(added, dict) else added or [])
+        new_labels = []
+        for label, coeff in added:
+            if label not in self.obs:
+                new_labels.append(label)
+            self.obs[label] = self.obs.get(label, 0) + np.real(coeff)
+        removed = set(removed or []) | {label for label, _ in added if abs(self.obs[label]) <= ROUND_ERROR}
+        for label in removed:
+            self.obs.pop(label, None)
+        new_labels = [label for label in dict.fromkeys(new_labels) if label in self.obs]
+        self.observable = None
+        self.adjacency = None
+        self._graph    = None
+        if getattr(self, "clique_dict", None) is None:
+            return
+
+        keys    = list(self.clique_dict.keys())
+        cliques = [list(nodes) for nodes in self.clique_dict.values()]
+        changed = set()
+        if removed:
+            for index, nodes in enumerate(cliques):
+                if not removed.isdisjoint(nodes):
+                    cliques[index] = [label for label in nodes if label not in removed]
+                    changed.add(index)
+
+        if new_labels:
+            new_x, new_z = unpack_labels(new_labels)
+            if self.grouping == "qubit_wise":
+                # a term is compatible with a clique iff it is compatible with its key
+                key_x, key_z = unpack_labels([get_most_complex_pauli_label(nodes) if nodes and index in changed else key for index, (key, nodes) in enumerate(zip(keys, cliques))])
+                alive = np.array([len(nodes) > 0 for nodes in cliques], dtype=bool)
+            else:
+                member_x, member_z = unpack_labels([label for nodes in cliques for label in nodes]) if any(cliques) else (np.zeros((0, self.n), dtype=bool),)*2
+                member_clique = np.repeat(np.arange(len(cliques)), [len(nodes) for nodes in cliques])
+            for label, x, z in zip(new_labels, new_x, new_z):
+                if self.grouping == "qubit_wise":
+                    conflict = ((key_x | key_z) & (x | z) & ((key_x ^ x) | (key_z ^ z))).any(axis=1)
+                    candidates = np.flatnonzero(~conflict & alive)
+                else:
+                    anticommute = np.sum((member_x & z) ^ (member_z & x), axis=1) % 2 == 1
+                    blocked = np.bincount(member_clique[anticommute], minlength=len(cliques)) > 0
+                    candidates = np.flatnonzero(~blocked & (np.bincount(member_clique, minlength=len(cliques)) > 0))
+                if candidates.size:
+                    index = int(candidates[0])
+                    cliques[index].append(label)
+                else:
+                    index = len(cliques)
+                    keys.append(None)
+                    cliques.append([label])
+                changed.add(index)
+                if self.grouping == "qubit_wise":
+                    if index == len(key_x):
+                        key_x, key_z, alive = np.vstack([key_x, x]), np.vstack([key_z, z]), np.append(alive, True)
+                    else:
+                        identity = ~(key_x[index] | key_z[index])
+                        key_x[index] |= x & identity
+                        key_z[index] |= z & identity
+                else:
+                    member_x, member_z = np.vstack([member_x, x]), np.vstack([member_z, z])
+                    member_clique = np.append(member_clique, index)
+
+        for index in sorted(changed):
+            if keys[index] is not None:
+                self._remove_clique(keys[index])
+        for index in sorted(changed):
+            if cliques[index]:
+                self._add_clique(cliques[index])
\ No newline at end of file
@@ -1,79 +1,256 @@
 import numpy as np
-import itertools
-import networkx as nx
-from .common import I,X,Y,Z,tensor,check_commute,check_simul,get_most_complex_pauli_label
-from ..minimum_clique_cover import clique_cover
+import scipy.sparse as sp
+from collections.abc import Mapping
+from .common import pauli_labels,pauli_matrices,pauli_index,pauli_index_map,get_most_complex_pauli_label
+from .sparse_pauli import SparsePauli, pauli_decompose
+from .symplectic import pack_labels, simul_matrix, commute_matrix
+from .clifford import CliffordTableau
+from ..minimum_clique_cover import clique_cover, graph_from_adjacency
 
 ROUND_ERROR = 1e-10
 
+class PauliTransferDict(Mapping):
+    def __init__(self, ptm):
+        """Read-only {(prep_label, meas_label): value} view of a PauliTransferMatrix"""
+        self.ptm = ptm
+
+    def __getitem__(self, node):
+        index = pauli_index_map(self.ptm.n)
+        return self.ptm.lookup(index[node[0]]*4**self.ptm.n + index[node[1]]).item()
+
+    def __iter__(self):
+        label = pauli_labels(self.ptm.n)
+        size  = 4**self.ptm.n
+        for key in self.ptm.key.tolist():
+            yield (label[key//size], label[key%size])
+
+    def __len__(self):
+        return self.ptm.key.size
+
+    def __contains__(self, node):
+        try:
+            self[node]
+        except KeyError:
+            return False
+        return True
+
+    def __repr__(self):
+        return repr(dict(self))
+
 class PauliTransferMatrix:
     def __init__(self,gate=None,ptm_dict=None):
+        """Pauli transfer matrix stored as sorted (key, value) arrays
+
+        The entry (prep, meas) = Tr(P_meas G(P_prep))/2^n is stored at
+        key = index(prep)*4^n + index(meas), where index follows pauli_labels(n).
+        Entries which are not stored are undefined (NaN in get_matrix).
+        The gate is a unitary matrix or a CliffordTableau.
+        """
         if (gate is not None) and (ptm_dict is not None):
             raise("input must be only [gate] or [ptm_dict]")
 
         if (gate is None) and (ptm_dict is None):
             raise("input must not be None")
 
+        self.key   = None
+        self.value = None
+
         if gate is not None:
             self.gate  = gate
-            self.n     = int(np.log2(gate.shape[0]))
-            self.ptm   = None
+            self.n     = gate.n if isinstance(gate, CliffordTableau) else int(np.log2(gate.shape[0]))
 
         if ptm_dict is not None:
             self.n = len(list(ptm_dict.keys())[0][0])
             self.ptm = ptm_dict
 
-        self.pauli = [tensor(list(i)) for i in itertools.product([I,X,Y,Z],repeat=self.n)]
-        self.label = [''.join(i) for i in itertools.product(['I','X','Y','Z'],repeat=self.n)]
+    @classmethod
+    def from_matrix(cls, matrix):
+        """Create from a 4^n x 4^n (prep, meas) matrix, dense with NaN for undefined entries or scipy.sparse"""
+        out = cls.__new__(cls)
+        out.key   = None
+        out.value = None
+        out.n     = int(round(np.log(matrix.shape[0])/np.log(4)))
+        if sp.issparse(matrix):
+            matrix = matrix.tocoo()
+            out.set_entries(matrix.row, matrix.col, matrix.data)
+        else:
+            prep_index, meas_index = np.nonzero(~np.isnan(matrix))
+            out.set_entries(prep_index, meas_index, matrix[prep_index, meas_index])
+        return out
+
+    @property
+    def ptm(self):
+        if self.key is None:
+            return None
+        return PauliTransferDict(self)
+
+    @ptm.setter
+    def ptm(self, ptm_dict):
+        if ptm_dict is None:
+            self.key   = None
+            self.value = None
+            return
+        nodes = list(ptm_dict.keys())
+        if not nodes:
+            self.set_entries([], [], [])
+            return
+        prep_labels, meas_labels = zip(*nodes)
+        self.set_entries(pauli_index(prep_labels), pauli_index(meas_labels), [ptm_dict[node] for node in nodes])
+
+    def set_entries(self, prep_index, meas_index, value):
+        key   = np.asarray(prep_index, dtype=np.int64)*4**self.n + np.asarray(meas_index, dtype=np.int64)
+        order = np.argsort(key, kind="stable")
+        self.key   = key[order]
+        self.value = np.asarray(value, dtype=np.float64)[order]
+
+    @property
+    def prep_index(self):
+        return self.key//4**self.n
+
+    @property
+    def meas_index(self):
+        return self.key%4**self.n
+
+    def lookup(self, key, default=None):
+        """Values stored at the given keys
+
+        Args:
+            key (np.ndarray): keys index(prep)*4^n + index(meas)
+            default (float): value for missing keys, KeyError is raised if None
+        Returns:
+            np.ndarray: values with the same shape as key
+        """
+        key = np.asarray(key, dtype=np.int64)
+        if self.key.size == 0:
+            found = np.zeros(key.shape, dtype=bool)
+            value = np.zeros(key.shape)
+        else:
+            position = np.minimum(np.searchsorted(self.key, key), self.key.size-1)
+            found    = self.key[position] == key
+            value    = self.value[position]
+        if default is None:
+            if not np.all(found):
+                raise KeyError("pauli transfer matrix has no entry for key {}".format(key[~found][:5]))
+            return value
+        return np.where(found, value, default)
+
+    @property
+    def label(self):
+        return pauli_labels(self.n)
+
+    @property
+    def pauli(self):
+        return pauli_matrices(self.n)
+
+    def conjugate(self, prep_label):
+        """Return gate @ P @ gate^dagger for the prep Pauli P"""
+        return self.gate@(SparsePauli(prep_label)@self.gate.T.conj())
+
+    def _calculate(self, prep_mask=None, meas_mask=None):
+        # Clifford gates map Paulis to signed Paulis, so the PTM is a signed permutation
+        tableau = self.gate if isinstance(self.gate, CliffordTableau) else CliffordTableau.from_unitary(self.gate)
+        if tableau is not None:
+            self.set_entries(*tableau.ptm_entries(prep_mask, meas_mask))
+            return
+
+        prep_list, meas_list, value_list = [], [], []
+        for prep_index, prep_label in enumerate(self.label):
+            if (prep_mask is not None) and (not prep_mask[prep_index]):
+                continue
+            row = pauli_decompose(self.conjugate(prep_label)).real/2**self.n
+            if meas_mask is not None:
+                row[~meas_mask] = 0
+            meas_index = np.flatnonzero(np.abs(row) > ROUND_ERROR)
+            prep_list.append(np.full(meas_index.size, prep_index))
+            meas_list.append(meas_index)
+            value_list.append(row[meas_index])
+        self.set_entries(np.concatenate(prep_list), np.concatenate(meas_list), np.concatenate(value_list))
 
     def calculate(self):
-        self.ptm = {}
-        for prep_label, prep_pauli in zip(self.label,self.pauli):
-            for meas_label, meas_pauli in zip(self.label,self.pauli):
-                value = np.trace(meas_pauli@self.gate@prep_pauli@self.gate.T.conj()).real/2**self.n
-                if abs(value) > ROUND_ERROR:
-                    self.ptm[(prep_label,meas_label)] = value
+        self._calculate()
 
     def get_complemented_ptm(self):
         out = {}
+        ptm = self.ptm
         for prep_label in self.label:
             for meas_label in self.label:
-                out[(prep_label,meas_label)] = self.ptm.get((prep_label,meas_label))
+                out[(prep_label,meas_label)] = ptm.get((prep_label,meas_label))
         return out
-    
-    def get_matrix(self):
-        matrix = np.zeros([4**self.n,4**self.n])
-        for i, pi in enumerate(self.label):
-            for j, pj in enumerate(self.label):
-                matrix[i,j] = self.ptm.get((pi,pj))
-        return matrix
 
     def get_matrix(self):
-        matrix = np.zeros([4**self.n,4**self.n])
-        for i, pi in enumerate(self.label):
-            for j, pj in enumerate(self.label):
-                matrix[i,j] = self.ptm.get((pi,pj))
+        matrix = np.full([4**self.n,4**self.n], np.nan)
+        matrix.flat[self.key] = self.value
         return matrix
 
+    def get_sparse_matrix(self):
+        return sp.csr_matrix((self.value, (self.prep_index, self.meas_index)), shape=(4**self.n,4**self.n))
+
     def get_unitarity(self):
-        matrix = self.get_matrix()
-        matrix = np.nan_to_num(matrix, 0)
-        unitarity = (np.trace(matrix.T@matrix)-1)/(4**self.n-1)
+        unitarity = (np.dot(self.value, self.value)-1)/(4**self.n-1)
         return unitarity
 
+    def __matmul__(self, other):
+        """PTM of the channel applying self first and then other
+
+        Undefined entries are treated as zero.
+        """
+        if self.n != other.n:
+            raise ValueError("number of qubits mismatch : {} and {}".format(self.n, other.n))
+        return PauliTransferMatrix.from_matrix(self.get_sparse_matrix()@other.get_sparse_matrix())
+
     def get_graph(self):
+        """Compatibility graph of the (prep, meas) nodes
+
+        Two nodes are adjacent when both their prep and meas Paulis are qubit-wise
+        compatible, so the graph is the strong product of the prep and meas
+        compatibility graphs restricted to the stored entries.
+        """
         nodes = list(self.ptm.keys())
-        edges = []
-        for (prep0,meas0), (prep1,meas1) in itertools.combinations(nodes,2):
-            if check_simul(prep0,prep1) and check_simul(meas0,meas1):
-                edges.append(((prep0,meas0),(prep1,meas1)))
-        self.graph = nx.Graph()
-        self.graph.add_nodes_from(nodes)
-        self.graph.add_edges_from(edges)
-
-    def get_clique_dict(self, strategy):
+        prep_unique, prep_inverse = np.unique(self.prep_index, return_inverse=True)
+        meas_unique, meas_inverse = np.unique(self.meas_index, return_inverse=True)
+        self.prep_labels = [self.label[i] for i in prep_unique]
+        self.meas_labels = [self.label[i] for i in meas_unique]
+        self.prep_adjacency = simul_matrix(*pack_labels(self.prep_labels))
+        self.meas_adjacency = simul_matrix(*pack_labels(self.meas_labels))
+        self.node_factor = (prep_inverse, meas_inverse)
+        self.adjacency = self.prep_adjacency[np.ix_(prep_inverse, prep_inverse)] & self.meas_adjacency[np.ix_(meas_inverse, meas_inverse)]
+        np.fill_diagonal(self.adjacency, False)
+        self.nodes  = nodes
+        self._graph = None
+
+    @property
+    def graph(self):
+        """networkx graph of get_graph, built on first use"""
+        if self._graph is None:
+            self._graph = graph_from_adjacency(self.adjacency, self.nodes)
+        return self._graph
+
+    def get_factorized_cover(self, strategy, **options):
+        """Cover the prep and meas graphs separately and combine the cliques pairwise
+
+        Args:
+            strategy (str): name of clique cover strategy for each factor
+        Returns:
+            list: list of nodes for each clique
+        """
+        prep_cover = clique_cover(self.prep_adjacency, strategy, **options)
+        meas_cover = clique_cover(self.meas_adjacency, strategy, **options)
+        prep_clique = {self.prep_labels[index]: i for i, clique in enumerate(prep_cover) for index in clique}
+        meas_clique = {self.meas_labels[index]: i for i, clique in enumerate(meas_cover) for index in clique}
+        nodes_dict = {}
+        for node in self.ptm.keys():
+            nodes_dict.setdefault((prep_clique[node[0]], meas_clique[node[1]]), []).append(node)
+        return list(nodes_dict.values())
+
+    def get_clique_dict(self, strategy, factorized=False, **options):
         self.get_graph()
-        nodes_list  = clique_cover(self.graph,strategy)
+        if factorized:
+            nodes_list = self.get_factorized_cover(strategy, **options)
+            self.clique_strategy = strategy
+        else:
+            cover      = clique_cover(self.adjacency,strategy,**options)
+            nodes_list = [[self.nodes[i] for i in clique] for clique in cover]
+            self.clique_strategy = getattr(cover, "strategy", strategy)
         self.clique_dict = {}
         for nodes in nodes_list:
             prep_labels, meas_labels = np.array(nodes).T
@@ -89,11 +266,7 @@ class StabilizerPauliTransferMatrix(PauliTransferMatrix):
         self.stabilizer_meas = stabilizer_meas
 
     def calculate(self):
-        self.ptm = {}
-        for prep_label, prep_pauli in zip(self.label,self.pauli):
-            for meas_label, meas_pauli in zip(self.label,self.pauli):
-                if False not in [check_commute(prep_label,st_prep) for st_prep in self.stabilizer_prep]:
-                    if False not in [check_commute(meas_label,st_meas) for st_meas in self.stabilizer_meas]:
-                        value = np.trace(meas_pauli@self.gate@prep_pauli@self.gate.T.conj()).real/2**self.n
-                        if abs(value) > ROUND_ERROR:
-                            self.ptm[(prep_label,meas_label)] = value
+        x, z      = pack_labels(self.label)
+        prep_mask = commute_matrix(x, z, *pack_labels(self.stabilizer_prep)).all(axis=1) if self.stabilizer_prep else None
+        meas_mask = commute_matrix(x, z, *pack_labels(self.stabilizer_meas)).all(axis=1) if self.stabilizer_meas else None
+        self._calculate(prep_mask, meas_mask)
@@ -0,0 +1,95 @@
+import numpy as np
+import scipy.sparse as sp
+from .common import dtype
+from .symplectic import popcount, label_index, walsh_hadamard
+
+class SparsePauli:
+    # let numpy defer matrix @ SparsePauli to __rmatmul__
+    __array_ufunc__ = None
+
+    def __init__(self, label):
+        """Pauli operator stored as a permutation with phases
+
+        The operator maps the computational basis state |c> to phase[c]|c^x>,
+        where qubit 0 is the most significant bit of c.
+
+        Args:
+            label (str): Pauli label such as "XIZ"
+        """
+        self.label = label
+        self.n     = len(label)
+        bits_x     = "".join("1" if p in "XY" else "0" for p in label)
+        bits_z     = "".join("1" if p in "YZ" else "0" for p in label)
+        self.x     = int(bits_x, 2) if self.n else 0
+        self.z     = int(bits_z, 2) if self.n else 0
+
+        index      = np.arange(2**self.n, dtype=np.int64)
+        self.perm  = index ^ self.x
+        sign       = 1 - 2*(popcount(index & self.z) % 2)
+        self.phase = (1j**(label.count("Y") % 4)*sign).astype(dtype)
+
+    def __matmul__(self, other):
+        """Apply the Pauli from the left to a vector or a matrix"""
+        other = np.asarray(other)
+        if other.ndim == 1:
+            return (self.phase*other)[self.perm]
+        return (self.phase[:, None]*other)[self.perm]
+
+    def __rmatmul__(self, other):
+        """Apply the Pauli from the right to a vector or a matrix"""
+        other = np.asarray(other)
+        if other.ndim == 1:
+            return other[self.perm]*self.phase
+        return other[:, self.perm]*self.phase[None, :]
+
+    def trace_dot(self, matrix):
+        """Return Tr(P @ matrix) in O(2^n)"""
+        return np.sum(self.phase*matrix[np.arange(2**self.n), self.perm])
+
+    def to_dense(self):
+        matrix = np.zeros((2**self.n, 2**self.n), dtype=dtype)
+        matrix[self.perm, np.arange(2**self.n)] = self.phase
+        return matrix
+
+    def to_sparse(self):
+        return sp.csr_matrix((self.phase, (self.perm, np.arange(2**self.n))), shape=(2**self.n, 2**self.n))
+
+def pauli_decompose(matrix):
+    """Return Tr(P @ matrix) for every Pauli P in the order of pauli_labels
+
+    Uses Tr(P @ M) = i^|x&z| sum_c (-1)^(c.z) M[c, c^x], so all 4^n traces are
+    obtained with one Walsh-Hadamard transform per x in O(n 4^n).
+
+    Args:
+        matrix (np.ndarray): 2^n x 2^n matrix
+    Returns:
+        np.ndarray: complex array with 4^n elements
+    """
+    size  = matrix.shape[0]
+    index = np.arange(size, dtype=np.int64)
+    x     = index[:, None]
+    trace = walsh_hadamard(matrix[index[None, :], index[None, :] ^ x], axis=1)
+    trace = trace*1j**(popcount(x & index[None, :]) % 4)
+    out   = np.empty(size*size, dtype=dtype)
+    out[label_index(x, index[None, :])] = trace
+    return out
+
+def pauli_compose(coefficients):
+    """Return sum_P coefficients[P] P for the Paulis P in the order of pauli_labels
+
+    Inverse of pauli_decompose up to a factor 2^n, using one Walsh-Hadamard
+    transform per x in O(n 4^n).
+
+    Args:
+        coefficients (np.ndarray): array with 4^n elements
+    Returns:
+        np.ndarray: 2^n x 2^n matrix
+    """
+    size   = int(round(np.sqrt(len(coefficients))))
+    index  = np.arange(size, dtype=np.int64)
+    x      = index[:, None]
+    values = np.asarray(coefficients, dtype=dtype)[label_index(x, index[None, :])]
+    values = values*(-1j)**(popcount(x & index[None, :]) % 4)
+    out    = np.empty((size, size), dtype=dtype)
+    out[index[None, :], index[None, :] ^ x] = walsh_hadamard(values, axis=1)
+    return out
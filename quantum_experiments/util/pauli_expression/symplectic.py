@@ -0,0 +1,170 @@
+"""Symplectic (x, z) representation of Pauli labels
+
+Qubit k of a label is stored in bit k of a big-endian packed uint8 row, i.e.
+qubit 0 is the most significant bit of the first byte. A single-qubit Pauli is
+encoded as I=(0,0), X=(1,0), Y=(1,1), Z=(0,1).
+"""
+import numpy as np
+
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+BLOCK_SIZE = 1024
+
+def popcount(array):
+    """Count set bits of each element of an unsigned integer array
+
+    Args:
+        array (np.ndarray): array of unsigned integers
+    Returns:
+        np.ndarray: number of set bits with the same shape as array
+    """
+    array = np.ascontiguousarray(array)
+    if array.dtype == np.uint8:
+        return POPCOUNT[array]
+    bytes_ = array.view(np.uint8).reshape(array.shape + (array.dtype.itemsize,))
+    return POPCOUNT[bytes_].sum(axis=-1, dtype=np.int64)
+
+def unpack_labels(labels):
+    """Convert Pauli labels into boolean (x, z) arrays
+
+    Args:
+        labels (list): list of Pauli labels with the same length
+    Returns:
+        tuple: boolean arrays x, z with shape (len(labels), n)
+    """
+    labels = list(labels)
+    n = len(labels[0])
+    chars = np.frombuffer("".join(labels).encode(), dtype=np.uint8).reshape(len(labels), n)
+    x = (chars == ord("X")) | (chars == ord("Y"))
+    z = (chars == ord("Z")) | (chars == ord("Y"))
+    return x, z
+
+def pack_labels(labels):
+    """Convert Pauli labels into bit-packed (x, z) arrays
+
+    Args:
+        labels (list): list of Pauli labels with the same length
+    Returns:
+        tuple: uint8 arrays x, z with shape (len(labels), ceil(n/8))
+    """
+    x, z = unpack_labels(labels)
+    return np.packbits(x, axis=1), np.packbits(z, axis=1)
+
+def to_labels(x, z, n=None):
+    """Convert (x, z) arrays back into Pauli labels
+
+    Args:
+        x (np.ndarray): boolean (N, n) array or packed uint8 (N, ceil(n/8)) array
+        z (np.ndarray): same shape as x
+        n (int): number of qubits, required for packed arrays
+    Returns:
+        list: list of Pauli labels
+    """
+    if x.dtype == np.uint8 and n is not None:
+        x = np.unpackbits(x, axis=1, count=n).astype(bool)
+        z = np.unpackbits(z, axis=1, count=n).astype(bool)
+    code = x.astype(np.uint8)*2 + z.astype(np.uint8)
+    chars = np.array([ord("I"), ord("Z"), ord("X"), ord("Y")], dtype=np.uint8)[code]
+    return [row.tobytes().decode() for row in chars]
+
+def _words(packed):
+    """View packed rows as uint64 words, padding the last word with zeros"""
+    width = -(-packed.shape[1]//8)*8
+    padded = np.zeros((packed.shape[0], width), dtype=np.uint8)
+    padded[:, :packed.shape[1]] = packed
+    return padded.view(">u8").astype(np.uint64)
+
+def _parity(words):
+    for shift in (32, 16, 8, 4, 2, 1):
+        words ^= words >> np.uint64(shift)
+    return (words & np.uint64(1)).astype(bool)
+
+def _pairwise(x0, z0, x1, z1, relation, combine):
+    """Evaluate a bitwise relation for all pairs of rows, word by word and block by block"""
+    x0, z0, x1, z1 = _words(x0), _words(z0), _words(x1), _words(z1)
+    out = np.zeros((x0.shape[0], x1.shape[0]), dtype=bool)
+    for start in range(0, x0.shape[0], BLOCK_SIZE):
+        stop = min(start+BLOCK_SIZE, x0.shape[0])
+        for word in range(x0.shape[1]):
+            block = out[start:stop]
+            combine(block, relation(x0[start:stop, word, None], z0[start:stop, word, None], x1[None, :, word], z1[None, :, word]), out=block)
+    return out
+
+def _anticommute_bits(x0, z0, x1, z1):
+    return _parity((x0 & z1) ^ (z0 & x1))
+
+def _conflict_bits(x0, z0, x1, z1):
+    return ((x0 | z0) & (x1 | z1) & ((x0 ^ x1) | (z0 ^ z1))) != 0
+
+def simul_matrix(x, z, x_other=None, z_other=None):
+    """Qubit-wise compatibility of all pairs of packed Paulis
+
+    Two Paulis are qubit-wise compatible when they are equal or identity on every qubit.
+
+    Args:
+        x (np.ndarray): packed uint8 array with shape (N, ceil(n/8))
+        z (np.ndarray): packed uint8 array with shape (N, ceil(n/8))
+        x_other (np.ndarray): packed uint8 array with shape (M, ceil(n/8)), defaults to x
+        z_other (np.ndarray): packed uint8 array with shape (M, ceil(n/8)), defaults to z
+    Returns:
+        np.ndarray: boolean (N, M) adjacency matrix, including the diagonal
+    """
+    if x_other is None:
+        x_other, z_other = x, z
+    return ~_pairwise(x, z, x_other, z_other, _conflict_bits, np.logical_or)
+
+def commute_matrix(x, z, x_other=None, z_other=None):
+    """Commutation of all pairs of packed Paulis
+
+    Args:
+        x (np.ndarray): packed uint8 array with shape (N, ceil(n/8))
+        z (np.ndarray): packed uint8 array with shape (N, ceil(n/8))
+        x_other (np.ndarray): packed uint8 array with shape (M, ceil(n/8)), defaults to x
+        z_other (np.ndarray): packed uint8 array with shape (M, ceil(n/8)), defaults to z
+    Returns:
+        np.ndarray: boolean (N, M) adjacency matrix, including the diagonal
+    """
+    if x_other is None:
+        x_other, z_other = x, z
+    return ~_pairwise(x, z, x_other, z_other, _anticommute_bits, np.logical_xor)
+
+def label_index(x, z):
+    """Position of Paulis in the itertools.product order of pauli_labels
+
+    Args:
+        x (np.ndarray): integer array whose bit n-1-k is the x bit of qubit k
+        z (np.ndarray): integer array with the same shape as x
+    Returns:
+        np.ndarray: index into pauli_labels(n)
+    """
+    x, z = np.asarray(x, dtype=np.int64), np.asarray(z, dtype=np.int64)
+    digit = np.array([0, 3, 1, 2], dtype=np.int64)
+    index = np.zeros(np.broadcast(x, z).shape, dtype=np.int64)
+    bit = 0
+    while ((x >> bit) | (z >> bit)).any():
+        index += digit[2*((x >> bit) & 1) + ((z >> bit) & 1)] << (2*bit)
+        bit += 1
+    return index
+
+def walsh_hadamard(array, axis=-1):
+    """Fast Walsh-Hadamard transform out[z] = sum_c (-1)^popcount(c&z) array[c]
+
+    Args:
+        array (np.ndarray): array whose length along axis is a power of two
+        axis (int): axis to transform
+    Returns:
+        np.ndarray: transformed array, computed in O(n 2^n) along the axis
+    """
+    array = np.moveaxis(np.array(array), axis, -1)
+    array = np.ascontiguousarray(array, dtype=np.result_type(array.dtype, np.float64))
+    shape = array.shape
+    size = shape[-1]
+    step = 1
+    while step < size:
+        view = array.reshape(shape[:-1] + (size//(2*step), 2, step))
+        low = view[..., 0, :].copy()
+        view[..., 0, :] += view[..., 1, :]
+        view[..., 1, :] *= -1
+        view[..., 1, :] += low
+        step *= 2
+    return np.moveaxis(array, -1, axis)
@@ -0,0 +1,2 @@
+from .state import linear_inversion_state, maximum_likelihood_state, project_density_matrix
+from .process import linear_inversion_process, maximum_likelihood_process, project_cptp, choi_to_ptm
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""Process tomography from Pauli eigenstate preparations and Pauli-basis measurements
+
+The Choi matrix J = sum_ij |i><j| (x) L(|i><j|) equals sum_PQ R[P, Q] P^T (x) Q / 2^n
+for the Pauli transfer matrix R[P, Q] = Tr(Q L(P))/2^n, and P^T = (-1)^#Y P.
+Preparing the eigenstate i of the prep basis A and measuring the basis B gives
+p[i, b] = sum_ST (-1)^(i.S + b.T) R[A_S, B_T] / 2^n, so all the settings are
+evaluated with one gather of R and one two-dimensional Walsh-Hadamard transform.
+"""
+import numpy as np
+from ..pauli_expression import PauliTransferMatrix
+from ..pauli_expression.sparse_pauli import pauli_decompose, pauli_compose
+from ..pauli_expression.symplectic import walsh_hadamard
+from .state import subset_index, frequencies, projected_gradient
+
+def _y_sign(n):
+    digit = np.arange(4**n, dtype=np.int64)[:, None]//4**np.arange(n, dtype=np.int64) % 4
+    return 1 - 2*(np.sum(digit == 2, axis=1) % 2)
+
+def choi_to_ptm_matrix(choi):
+    """Dense 4^n x 4^n Pauli transfer matrix of a Choi matrix"""
+    n = int(round(np.log2(choi.shape[0])))//2
+    return _y_sign(n)[:, None]*pauli_decompose(choi).real.reshape(4**n, 4**n)/2**n
+
+def ptm_matrix_to_choi(ptm):
+    """Choi matrix of a dense 4^n x 4^n Pauli transfer matrix"""
+    n = int(round(np.log(ptm.shape[0])/np.log(4)))
+    return pauli_compose((_y_sign(n)[:, None]*ptm).ravel()/2**n)
+
+def choi_to_ptm(choi):
+    """PauliTransferMatrix with all the 16^n entries of a Choi matrix
+
+    Args:
+        choi (np.ndarray): 4^n x 4^n Choi matrix
+    Returns:
+        PauliTransferMatrix: Pauli transfer matrix
+    """
+    return PauliTransferMatrix.from_matrix(choi_to_ptm_matrix(choi))
+
+def project_cptp(choi, max_iteration=1000, tolerance=1e-10):
+    """Closest completely positive and trace preserving Choi matrix
+
+    Dykstra's alternating projections onto the trace preserving affine set
+    Tr_out J = I and onto the positive semidefinite cone.
+
+    Args:
+        choi (np.ndarray): Hermitian 4^n x 4^n matrix
+        max_iteration (int): maximum number of alternating projections
+        tolerance (float): stops when the two projections agree within tolerance
+    Returns:
+        np.ndarray: Choi matrix
+    """
+    size = int(round(np.sqrt(choi.shape[0])))
+    identity = np.eye(size)
+
+    def project_tp(matrix):
+        partial = np.einsum("iaja->ij", matrix.reshape(size, size, size, size))
+        return matrix + np.kron(identity - partial, identity)/size
+
+    def project_cp(matrix):
+        value, vector = np.linalg.eigh((matrix + matrix.T.conj())/2)
+        return (vector*np.clip(value, 0, None))@vector.T.conj()
+
+    matrix = choi
+    correction_tp = np.zeros_like(choi)
+    correction_cp = np.zeros_like(choi)
+    for _ in range(max_iteration):
+        trace_preserving = project_tp(matrix + correction_tp)
+        correction_tp    = matrix + correction_tp - trace_preserving
+        matrix           = project_cp(trace_preserving + correction_cp)
+        correction_cp    = trace_preserving + correction_cp - matrix
+        if np.linalg.norm(matrix - trace_preserving) < tolerance:
+            break
+    return matrix
+
+def _process_data(data_table):
+    """Subset indices of the prep and meas bases and (settings, 2^n, 2^n) frequencies"""
+    prep_bases = [key[0] for key in data_table.keys()]
+    meas_bases = [key[1] for key in data_table.keys()]
+    n    = len(prep_bases[0])
+    prep = np.array([subset_index(basis) for basis in prep_bases])
+    meas = np.array([subset_index(basis) for basis in meas_bases])
+    freq = np.zeros((len(prep_bases), 2**n, 2**n))
+    for row, histograms in enumerate(data_table.values()):
+        index = [int(prep_index, 2) for prep_index in histograms.keys()]
+        freq[row, index] = frequencies(list(histograms.values()))
+    return prep, meas, freq
+
+def _transform(array):
+    return walsh_hadamard(walsh_hadamard(array, axis=1), axis=2)
+
+def linear_inversion_process(data_table):
+    """Choi matrix from R[A_S, B_T] averaged over the settings measuring them
+
+    Args:
+        data_table (dict): {(prep_pauli, meas_pauli): {prep_index: histogram}} of DirectEstimation
+            with every prep_index of every setting
+    Returns:
+        np.ndarray: Hermitian Choi matrix, not necessarily CPTP
+    """
+    prep, meas, freq = _process_data(data_table)
+    size  = prep.shape[1]
+    total = np.zeros((size*size, size*size))
+    count = np.zeros((size*size, size*size))
+    rows, cols = prep[:, :, None], meas[:, None, :]
+    np.add.at(total, (rows, cols), _transform(freq)/size)
+    np.add.at(count, (rows, cols), 1)
+    ptm = total/np.maximum(count, 1)
+    ptm[0, 0] = 1
+    return ptm_matrix_to_choi(ptm)
+
+def maximum_likelihood_process(data_table, max_iteration=1000, tolerance=1e-10):
+    """CPTP Choi matrix maximizing the likelihood of the measured frequencies
+
+    Projected gradient descent with the projection of project_cptp.
+
+    Args:
+        data_table (dict): {(prep_pauli, meas_pauli): {prep_index: histogram}} of DirectEstimation
+        max_iteration (int): maximum number of projected gradient steps
+        tolerance (float): stops when the step is smaller
+    Returns:
+        np.ndarray: Choi matrix
+    """
+    prep, meas, freq = _process_data(data_table)
+    size = prep.shape[1]
+    sign = _y_sign(size.bit_length()-1)
+    rows, cols = prep[:, :, None], meas[:, None, :]
+
+    def likelihood(choi):
+        prob = _transform(choi_to_ptm_matrix(choi)[rows, cols])/size
+        if np.any(prob[freq > 0] <= 0):
+            return np.inf, prob
+        return -np.sum(freq[freq > 0]*np.log(prob[freq > 0])), prob
+
+    def gradient(choi, prob):
+        weight = np.where(freq > 0, -freq/np.where(prob > 0, prob, 1), 0)
+        grad   = np.zeros((size*size, size*size))
+        np.add.at(grad, (rows, cols), _transform(weight)/size)
+        return pauli_compose((sign[:, None]*grad).ravel()/size)
+
+    start = 0.9*project_cptp(linear_inversion_process(data_table)) + 0.1*np.eye(size*size)/size
+    return projected_gradient(start, likelihood, gradient, project_cptp, max_iteration, tolerance)
@@ -0,0 +1,158 @@
+"""State tomography from Pauli-basis measurements
+
+A basis B such as "XZY" gives the probabilities p[b] of the outcomes b, and its
+Walsh-Hadamard transform gives 2^n <B_S> for every subset S of the qubits, where
+B_S is B with identity outside of S. Both linear inversion and the likelihood are
+therefore evaluated for all settings with one transform and one gather into the
+4^n Pauli expectation values Tr(P rho).
+"""
+import numpy as np
+from ..histogram import Histogram
+from ..pauli_expression.sparse_pauli import pauli_decompose, pauli_compose
+from ..pauli_expression.symplectic import label_index, walsh_hadamard
+
+def subset_index(basis):
+    """Position in pauli_labels of B_S for every subset mask S of the qubits of basis B
+
+    Args:
+        basis (str): Pauli label without identities
+    Returns:
+        np.ndarray: array of length 2^n indexed by S, qubit 0 being the most significant bit
+    """
+    n    = len(basis)
+    mask = np.arange(2**n, dtype=np.int64)
+    x    = int("".join("1" if p in "XY" else "0" for p in basis), 2)
+    z    = int("".join("1" if p in "YZ" else "0" for p in basis), 2)
+    return label_index(x & mask, z & mask)
+
+def frequencies(histograms):
+    """Dense normalized frequencies, negative values of mitigated histograms set to zero
+
+    Args:
+        histograms (list): Histograms or dicts of the same number of qubits
+    Returns:
+        np.ndarray: (len(histograms), 2^n) array
+    """
+    out = np.array([Histogram.from_dict(histogram, dense=True).count for histogram in histograms])
+    out = np.clip(out, 0, None)
+    return out/out.sum(axis=1, keepdims=True)
+
+def project_density_matrix(matrix):
+    """Closest positive semidefinite matrix with unit trace in the Frobenius norm
+
+    Args:
+        matrix (np.ndarray): Hermitian matrix
+    Returns:
+        np.ndarray: density matrix
+    """
+    value, vector = np.linalg.eigh((matrix + matrix.T.conj())/2)
+    # projection of the eigenvalues onto the probability simplex
+    order  = np.sort(value)[::-1]
+    cumsum = np.cumsum(order) - 1
+    rank   = np.flatnonzero(order - cumsum/np.arange(1, len(order)+1) > 0)[-1]
+    value  = np.clip(value - cumsum[rank]/(rank+1), 0, None)
+    return (vector*value)@vector.T.conj()
+
+def _state_data(data_table):
+    """Bases, subset indices and frequencies of a {(prep_pauli, meas_pauli): {prep_index: histogram}} table"""
+    bases = [key[1] for key in data_table.keys()]
+    index = np.array([subset_index(basis) for basis in bases])
+    freq  = frequencies([list(histograms.values())[0] for histograms in data_table.values()])
+    return index, freq
+
+def linear_inversion_state(data_table):
+    """Density matrix sum_P <P> P / 2^n with <P> averaged over the bases measuring P
+
+    Args:
+        data_table (dict): {(prep_pauli, meas_pauli): {prep_index: histogram}} of DirectEstimation
+    Returns:
+        np.ndarray: Hermitian matrix with unit trace, not necessarily positive
+    """
+    index, freq = _state_data(data_table)
+    n     = index.shape[1].bit_length() - 1
+    total = np.zeros(4**n)
+    count = np.zeros(4**n)
+    np.add.at(total, index, walsh_hadamard(freq, axis=1))
+    np.add.at(count, index, 1)
+    return pauli_compose(total/np.maximum(count, 1))/2**n
+
+def _negative_log_likelihood(expect, index, freq):
+    prob = walsh_hadamard(expect[index], axis=1)/index.shape[1]
+    if np.any(prob[freq > 0] <= 0):
+        return np.inf, prob
+    return -np.sum(freq[freq > 0]*np.log(prob[freq > 0])), prob
+
+def projected_gradient(start, likelihood, gradient, project, max_iteration=1000, tolerance=1e-10):
+    """Minimize likelihood over the image of project by accelerated projected gradient descent
+
+    Steps are taken from the extrapolated point x + k/(k+3) (x - x_previous), and the
+    extrapolation restarts when the likelihood increases or is undefined there. The
+    step size is halved until the Armijo condition of the projected step holds, and
+    doubled at the next iteration.
+
+    Args:
+        start (np.ndarray): feasible starting matrix with finite likelihood
+        likelihood (function): matrix -> (value, auxiliary data)
+        gradient (function): (matrix, auxiliary data) -> Hermitian gradient matrix
+        project (function): projection onto the feasible set
+        max_iteration (int): maximum number of iterations
+        tolerance (float): stops when the Frobenius norm of the step is smaller
+    Returns:
+        np.ndarray: minimizer
+    """
+    matrix   = start
+    previous = start
+    value, _ = likelihood(matrix)
+    step     = 1.0
+    momentum = 0
+    for _ in range(max_iteration):
+        point = matrix + momentum/(momentum+3)*(matrix - previous)
+        point_value, data = likelihood(point)
+        if not np.isfinite(point_value):
+            point, momentum = matrix, 0
+            point_value, data = likelihood(point)
+        grad = gradient(point, data)
+        while True:
+            trial = project(point - step*grad)
+            delta = trial - point
+            trial_value, _ = likelihood(trial)
+            if trial_value <= point_value + np.real(np.vdot(grad, delta)) + np.vdot(delta, delta).real/(2*step) or step < 1e-12:
+                break
+            step /= 2
+        if trial_value <= value:
+            previous, matrix, value = matrix, trial, trial_value
+            momentum += 1
+            if np.linalg.norm(matrix - previous) < tolerance:
+                break
+        elif momentum:
+            previous, momentum = matrix, 0
+        else:
+            break
+        step *= 2
+    return matrix
+
+def maximum_likelihood_state(data_table, max_iteration=1000, tolerance=1e-10):
+    """Density matrix maximizing the likelihood of the measured frequencies
+
+    Args:
+        data_table (dict): {(prep_pauli, meas_pauli): {prep_index: histogram}} of DirectEstimation
+        max_iteration (int): maximum number of projected gradient steps
+        tolerance (float): stops when the step is smaller
+    Returns:
+        np.ndarray: density matrix
+    """
+    index, freq = _state_data(data_table)
+    size = index.shape[1]
+
+    def likelihood(rho):
+        return _negative_log_likelihood(pauli_decompose(rho).real, index, freq)
+
+    def gradient(rho, prob):
+        # adjoint of the gather and of the transform, then sum_P g_P P
+        weight = np.where(freq > 0, -freq/np.where(prob > 0, prob, 1), 0)
+        grad   = np.zeros(size*size)
+        np.add.at(grad, index, walsh_hadamard(weight, axis=1)/size)
+        return pauli_compose(grad)
+
+    start = 0.9*project_density_matrix(linear_inversion_state(data_table)) + 0.1*np.eye(size)/size
+    return projected_gradient(start, likelihood, gradient, project_density_matrix, max_iteration, tolerance)